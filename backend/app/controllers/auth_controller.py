@@ -1,10 +1,10 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config.settings import settings
-from app.database.engine import get_db
-from app.database.repositories.shop_installation_repository import ShopInstallationRepository
+from app.database.engine import get_async_db
+from app.database.repositories.shop_installation_repository import AsyncShopInstallationRepository
 from app.schemas.auth_schemas import (
     ShopInstallationOut,
     ShopInstallationsResponse,
@@ -26,7 +26,7 @@ class AuthController:
     async def callback(
         self,
         query_params: dict[str, str],
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
     ) -> RedirectResponse:
         shop = query_params.get("shop", "<unknown>")
         logger.info("callback — shop=%s", shop)
@@ -44,7 +44,7 @@ class AuthController:
         return RedirectResponse(url=redirect_url, status_code=302)
 
     async def get_shop_connection(
-        self, shop: str, db: Session = Depends(get_db)
+        self, shop: str, db: AsyncSession = Depends(get_async_db)
     ) -> ShopInstallationsResponse:
         logger.info("get_shop_connection — shop=%s", shop)
 
@@ -55,8 +55,8 @@ class AuthController:
                 detail="Invalid shop domain format.",
             )
 
-        repo = ShopInstallationRepository(db)
-        records = repo.get_by_shop(shop)
+        repo = AsyncShopInstallationRepository(db)
+        records = await repo.get_by_shop(shop)
 
         logger.debug(
             "get_shop_connection — shop=%s records_found=%d", shop, len(records)
@@ -1,16 +1,114 @@
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
+from sqlalchemy.pool import StaticPool
 
 from app.config.settings import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
 
 
 class Base(DeclarativeBase):
     pass
 
 
-engine = create_engine(settings.sqlite_url, connect_args={"check_same_thread": False})
+def _sqlite_pragmas() -> list[str]:
+    return [
+        f"PRAGMA journal_mode={settings.sqlite_journal_mode}",
+        f"PRAGMA synchronous={settings.sqlite_synchronous}",
+        f"PRAGMA mmap_size={settings.sqlite_mmap_size}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size=-{settings.sqlite_cache_size_kib}",
+        f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}",
+    ]
+
+
+def _is_memory_db(url: URL) -> bool:
+    return url.database in (None, "", ":memory:") or "mode=memory" in str(url)
+
+
+def _pool_kwargs() -> dict:
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout_seconds,
+    }
+
+
+def _postgres_connect_args(url: URL) -> dict:
+    """Per-connection statement timeout, in the form the driver expects."""
+    if settings.db_statement_timeout_ms <= 0:
+        return {}
+    timeout = str(settings.db_statement_timeout_ms)
+    if url.get_driver_name() == "asyncpg":
+        return {"server_settings": {"statement_timeout": timeout}}
+    return {"options": f"-c statement_timeout={timeout}"}
+
+
+def _engine_kwargs(url: URL) -> dict:
+    backend = url.get_backend_name()
+    if backend == "postgresql":
+        return {
+            **_pool_kwargs(),
+            # Drop connections the server (or a proxy) closed while idle in the pool
+            "pool_pre_ping": True,
+            "pool_recycle": settings.db_pool_recycle_seconds,
+            "connect_args": _postgres_connect_args(url),
+        }
+    if backend != "sqlite":
+        return {}
+    kwargs: dict = {"connect_args": {"check_same_thread": False}}
+    if _is_memory_db(url):
+        # Every new connection would get its own empty in-memory database
+        kwargs["poolclass"] = StaticPool
+    else:
+        kwargs.update(_pool_kwargs())
+    return kwargs
+
+
+def _install_sqlite_profile(sync_engine: Engine) -> None:
+    """Apply the performance PRAGMAs on every new DBAPI connection."""
+    if sync_engine.dialect.name != "sqlite" or settings.sqlite_profile != "performance":
+        return
+    pragmas = _sqlite_pragmas()
+
+    @event.listens_for(sync_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def _build_engine(database_url: str) -> Engine:
+    url = make_url(database_url)
+    sync_engine = create_engine(url, **_engine_kwargs(url))
+    _install_sqlite_profile(sync_engine)
+    if sync_engine.dialect.name == "sqlite" and settings.sqlite_profile == "performance":
+        logger.info(
+            f"SQLite performance profile: journal_mode={settings.sqlite_journal_mode}, "
+            f"synchronous={settings.sqlite_synchronous}, busy_timeout={settings.sqlite_busy_timeout_ms}ms"
+        )
+    elif sync_engine.dialect.name == "postgresql":
+        logger.info(
+            f"Postgres engine: pool_size={settings.db_pool_size}, max_overflow={settings.db_max_overflow}, "
+            f"statement_timeout={settings.db_statement_timeout_ms}ms"
+        )
+    return sync_engine
+
+
+def safe_database_url() -> str:
+    """The configured database URL with any password masked — for logs."""
+    return make_url(settings.resolved_database_url).render_as_string(hide_password=True)
+
+
+engine = _build_engine(settings.resolved_database_url)
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, class_=Session)
 
 
@@ -20,3 +118,59 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+
+# ── Async engine (async route handlers) ────────────────────────────────────────
+# Same database as `engine`, reached through an async driver so queries don't
+# block the event loop. Built on first use so scripts that only need the sync
+# engine don't import the async drivers.
+# NOTE: a ":memory:" URL gives the async engine its own, separate database.
+
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+_async_engine: AsyncEngine | None = None
+_async_sessionmaker: async_sessionmaker[AsyncSession] | None = None
+
+
+def async_database_url(database_url: str) -> URL:
+    """Swap the sync driver for its async counterpart (sqlite → aiosqlite, postgresql → asyncpg)."""
+    url = make_url(database_url)
+    if url.get_driver_name() in ("aiosqlite", "asyncpg"):
+        return url
+    driver = _ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for database backend {url.get_backend_name()!r}")
+    return url.set(drivername=driver)
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine, _async_sessionmaker
+    if _async_engine is None:
+        url = async_database_url(settings.resolved_database_url)
+        _async_engine = create_async_engine(url, **_engine_kwargs(url))
+        _install_sqlite_profile(_async_engine.sync_engine)
+        _async_sessionmaker = async_sessionmaker(
+            bind=_async_engine, autoflush=False, expire_on_commit=False, class_=AsyncSession
+        )
+        logger.info(f"Async database engine created — driver={url.drivername}")
+    return _async_engine
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    """Async twin of SessionLocal — use as `async with AsyncSessionLocal() as db:`."""
+    get_async_engine()
+    return _async_sessionmaker()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def dispose_async_engine() -> None:
+    """Close pooled async connections (called on app shutdown)."""
+    global _async_engine, _async_sessionmaker
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_sessionmaker = None
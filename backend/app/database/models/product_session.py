@@ -5,6 +5,9 @@ Tracks the products shown to each WhatsApp user (keyed by phone number).
 Used for two purposes:
   1. Provide context to the AI about previously shown products
   2. Exclude already-shown handles from the next search
+
+This is the per-phone header row; the products themselves live in
+session_products (see SessionProduct).
 """
 from datetime import datetime, timezone
 
@@ -22,13 +25,14 @@ class ProductSession(Base):
     # WhatsApp phone number (E.164 format without '+', e.g. "923001234567")
     phone_number: Mapped[str] = mapped_column(String(30), index=True, unique=True)
 
-    # JSON list of product dicts: [{title, color, size, price, type, handle, description}, ...]
-    # Capped at settings.session_max_products entries (rolling window)
+    # DEPRECATED — legacy JSON list of product dicts. Rows are moved into
+    # session_products by migrate_legacy_sessions() on startup and this is reset to "[]".
     products_json: Mapped[str] = mapped_column(Text, default="[]")
 
-    # Last activity — used for TTL checks
+    # Last activity — used for TTL checks (see ProductSessionRepository.delete_expired)
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
+        index=True,
         default=lambda: datetime.now(timezone.utc),
         onupdate=lambda: datetime.now(timezone.utc),
     )
@@ -0,0 +1,42 @@
+"""
+Session Product Model
+─────────────────────
+One row per product shown to a WhatsApp user — the normalized replacement
+for the ProductSession.products_json blob.
+
+Appends only insert the new rows, and the (phone_number, shown_at) index
+serves both "last N shown products" and "all shown handles" without
+decoding the whole history.
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import JSON, DateTime, Index, Integer, String, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database.engine import Base
+
+
+class SessionProduct(Base):
+    __tablename__ = "session_products"
+    __table_args__ = (
+        Index("ix_session_products_phone_shown", "phone_number", "shown_at"),
+        # A handle appears at most once per phone — re-showing it moves it to the front
+        UniqueConstraint("phone_number", "handle", name="uq_session_product_handle"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    # WhatsApp phone number (same format as ProductSession.phone_number)
+    phone_number: Mapped[str] = mapped_column(String(30))
+
+    # Product handle — NULL for products without one (never deduplicated)
+    handle: Mapped[str | None] = mapped_column(String(255), nullable=True)
+
+    shown_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+
+    # Product dict: {title, color, size, price, type, handle, description}
+    # JSON text on SQLite, JSONB on Postgres
+    payload: Mapped[dict] = mapped_column(JSON().with_variant(JSONB(), "postgresql"), default=dict)
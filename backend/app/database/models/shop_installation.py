@@ -33,6 +33,8 @@ class ShopInstallation(Base):
     # INACTIVE | CONNECTING | ACTIVE | DISCONNECTED | ERROR
     wa_status: Mapped[str | None] = mapped_column(String(50), nullable=True, default="INACTIVE")
     wa_phone_number: Mapped[str | None] = mapped_column(String(50), nullable=True)
-    # Latest QR code data URI — overwritten each time the platform pushes a new one
-    wa_qr_code: Mapped[str | None] = mapped_column(String(10000), nullable=True)
+    # Content hash of the latest QR in wa_qr_images (see WaQrImage). Stored in the
+    # former wa_qr_code column, which held the full data URI — legacy values are
+    # moved out by migrate_legacy_qr_codes() on startup.
+    wa_qr_hash: Mapped[str | None] = mapped_column("wa_qr_code", String(10000), nullable=True)
 
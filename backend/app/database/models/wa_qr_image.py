@@ -0,0 +1,35 @@
+"""
+WhatsApp QR Image Model
+───────────────────────
+Latest WhatsApp linking QR per shop, stored as decoded image bytes instead of
+a multi-KB data URI on the installation row.
+
+Rows are addressed by a SHA-256 of the image bytes, so the image endpoint can
+be served with a strong ETag and cached as immutable — a new QR gets a new hash
+(and URL) and replaces the shop's previous row.
+"""
+from datetime import datetime, timezone
+
+from sqlalchemy import DateTime, Integer, LargeBinary, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database.engine import Base
+
+
+class WaQrImage(Base):
+    __tablename__ = "wa_qr_images"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    # One live QR per shop — overwritten each time the platform pushes a new one
+    shop_domain: Mapped[str] = mapped_column(String(255), unique=True)
+
+    # Hex SHA-256 of `data`
+    content_hash: Mapped[str] = mapped_column(String(64), index=True)
+
+    mime_type: Mapped[str] = mapped_column(String(50), default="image/png")
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
@@ -1,19 +1,108 @@
 """
 Product Session Repository
 ──────────────────────────
-Thin data-access layer for ProductSession.
+Thin data-access layer for ProductSession + SessionProduct.
 
-Stores ALL products ever shown to a phone number (no cap).
+Stores the products shown to a phone number, one row per product in
+session_products. Idle sessions expire and long histories are compacted by
+the sweeper (delete_expired / compact).
 Used for:
-  1. AI context — "Previously shown products: ..."
+  1. AI context — "Previously shown products: ..."  (last N rows, indexed)
   2. Handle exclusion — filter out already-seen handles from next search
 """
 import json
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.database.models.product_session import ProductSession
+from app.database.models.session_product import SessionProduct
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+# ── Shared query building (sync + async repositories) ─────────────────────────
+
+def _header_stmt(phone_number: str):
+    return select(ProductSession).where(ProductSession.phone_number == phone_number)
+
+
+def _shown_handles_stmt(phone_number: str):
+    return (
+        select(SessionProduct.handle)
+        .where(
+            SessionProduct.phone_number == phone_number,
+            SessionProduct.handle.is_not(None),
+        )
+        .order_by(SessionProduct.shown_at.asc(), SessionProduct.id.asc())
+    )
+
+
+def _recent_payloads_stmt(phone_number: str, limit: int | None = None):
+    stmt = (
+        select(SessionProduct.payload)
+        .where(SessionProduct.phone_number == phone_number)
+        .order_by(SessionProduct.shown_at.desc(), SessionProduct.id.desc())
+    )
+    return stmt.limit(limit) if limit is not None else stmt
+
+
+def _dedup_products(new_products: list[dict]) -> list[dict]:
+    """
+    Drop repeated handles, keeping each one's last occurrence in place. Everything
+    else (including products without a handle) stays in the order it was shown.
+    """
+    seen: set[str] = set()
+    kept: list[dict] = []
+    for p in reversed(new_products):
+        handle = p.get("handle")
+        if handle:
+            if handle in seen:
+                continue
+            seen.add(handle)
+        kept.append(p)
+    return kept[::-1]
+
+
+def _insert_for(dialect_name: str):
+    """INSERT construct with ON CONFLICT support for the session's backend."""
+    return pg_insert if dialect_name == "postgresql" else sqlite_insert
+
+
+def _touch_session_stmt(dialect_name: str, phone_number: str, now: datetime):
+    """Create the phone's header row, or bump its updated_at."""
+    stmt = _insert_for(dialect_name)(ProductSession).values(
+        phone_number=phone_number, products_json="[]", updated_at=now,
+    )
+    return stmt.on_conflict_do_update(index_elements=["phone_number"], set_={"updated_at": now})
+
+
+def _upsert_products_stmt(dialect_name: str, phone_number: str, products: list[dict], now: datetime):
+    """
+    Insert the products; a handle already shown to this phone is updated in place.
+    A single statement, so overlapping turns for one phone can't both insert a handle.
+    """
+    # A re-shown handle keeps its row (and id), so order within the append is
+    # carried by shown_at alone — one microsecond apart, in list order.
+    rows = [
+        {
+            "phone_number": phone_number,
+            "handle":       p.get("handle") or None,
+            "shown_at":     now + timedelta(microseconds=i),
+            "payload":      p,
+        }
+        for i, p in enumerate(products)
+    ]
+    stmt = _insert_for(dialect_name)(SessionProduct).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["phone_number", "handle"],
+        set_={"shown_at": stmt.excluded.shown_at, "payload": stmt.excluded.payload},
+    )
 
 
 class ProductSessionRepository:
@@ -21,59 +110,182 @@ class ProductSessionRepository:
         self.db = db
 
     def get(self, phone_number: str) -> ProductSession | None:
-        return (
-            self.db.query(ProductSession)
-            .filter(ProductSession.phone_number == phone_number)
-            .first()
-        )
+        return self.db.execute(_header_stmt(phone_number)).scalars().first()
 
-    def get_products(self, phone_number: str) -> list[dict]:
-        """Return all stored products for this phone number, or [] if none."""
-        row = self.get(phone_number)
-        if row is None:
-            return []
-        return json.loads(row.products_json or "[]")
+    def get_products(self, phone_number: str, limit: int | None = None) -> list[dict]:
+        """
+        Return stored products for this phone number, oldest first, or [] if none.
+        With `limit`, only the `limit` most recently shown products are returned.
+        """
+        payloads = list(self.db.execute(_recent_payloads_stmt(phone_number, limit)).scalars())
+        return list(reversed(payloads))
 
     def get_shown_handles(self, phone_number: str) -> list[str]:
-        """Return a list of handles already shown to this phone number."""
-        products = self.get_products(phone_number)
-        return [p["handle"] for p in products if p.get("handle")]
+        """Return the handles already shown to this phone number, oldest first."""
+        return list(self.db.execute(_shown_handles_stmt(phone_number)).scalars())
+
+    def load_session(self, phone_number: str, context_limit: int) -> tuple[list[str], list[dict]]:
+        """
+        Everything a WhatsApp turn needs: (shown handles oldest first, the
+        `context_limit` most recent products oldest first). Two indexed queries —
+        handles only, then just the `context_limit` newest payloads.
+        """
+        handles = self.get_shown_handles(phone_number)
+        recent = self.get_products(phone_number, context_limit) if context_limit > 0 else []
+        return handles, recent
 
     def append_products(
         self,
         phone_number: str,
         new_products: list[dict],
-    ) -> ProductSession:
+        commit: bool = True,
+    ) -> None:
         """
         Append new_products to this phone's session.
-        All products are kept — no rolling window.
-        Duplicate handles are deduplicated (last occurrence wins).
+        History is capped by the sweeper (compact), not here.
+        Duplicate handles are deduplicated (last occurrence wins, and moves to most recent).
+        Header and rows are written with ON CONFLICT upserts, so concurrent turns
+        for one phone never collide on the (phone_number, handle) constraint.
+        Existing history is never read.
+        commit=False leaves the transaction open so callers can batch several phones.
         """
-        row = self.get(phone_number)
-        if row is None:
-            row = ProductSession(phone_number=phone_number, products_json="[]")
-            self.db.add(row)
-
-        existing: list[dict] = json.loads(row.products_json or "[]")
-
-        # Merge: keep existing, overwrite with new if same handle
-        merged: dict[str, dict] = {p["handle"]: p for p in existing if p.get("handle")}
-        for p in new_products:
-            if p.get("handle"):
-                merged[p["handle"]] = p
+        now = datetime.now(timezone.utc)
+        dialect_name = self.db.get_bind().dialect.name
 
-        # Products without a handle are always appended
-        no_handle = [p for p in existing + new_products if not p.get("handle")]
-
-        row.products_json = json.dumps(list(merged.values()) + no_handle)
-        row.updated_at = datetime.now(timezone.utc)
-        self.db.commit()
-        self.db.refresh(row)
-        return row
+        self.db.execute(_touch_session_stmt(dialect_name, phone_number, now))
+        products = _dedup_products(new_products)
+        if products:
+            self.db.execute(_upsert_products_stmt(dialect_name, phone_number, products, now))
+        if commit:
+            self.db.commit()
 
     def clear(self, phone_number: str) -> None:
         """Remove all stored products for a phone number."""
+        self.db.execute(delete(SessionProduct).where(SessionProduct.phone_number == phone_number))
         row = self.get(phone_number)
         if row:
             self.db.delete(row)
+        self.db.commit()
+
+    def delete_expired(self, cutoff: datetime, batch_size: int) -> list[str]:
+        """
+        Delete up to `batch_size` sessions idle since before `cutoff` (header + rows).
+        Returns the phone numbers removed — call again until it returns fewer than batch_size.
+        """
+        phones = list(self.db.execute(
+            select(ProductSession.phone_number)
+            .where(ProductSession.updated_at < cutoff)
+            .limit(batch_size)
+        ).scalars())
+        if not phones:
+            return []
+        self.db.execute(delete(SessionProduct).where(SessionProduct.phone_number.in_(phones)))
+        self.db.execute(delete(ProductSession).where(ProductSession.phone_number.in_(phones)))
+        self.db.commit()
+        return phones
+
+    def compact(self, max_products: int, batch_size: int) -> list[str]:
+        """
+        Trim up to `batch_size` phones holding more than `max_products` rows down to
+        their newest `max_products`. Returns the phone numbers compacted.
+        """
+        phones = list(self.db.execute(
+            select(SessionProduct.phone_number)
+            .group_by(SessionProduct.phone_number)
+            .having(func.count() > max_products)
+            .limit(batch_size)
+        ).scalars())
+        for phone in phones:
+            keep = (
+                select(SessionProduct.id)
+                .where(SessionProduct.phone_number == phone)
+                .order_by(SessionProduct.shown_at.desc(), SessionProduct.id.desc())
+                .limit(max_products)
+            )
+            self.db.execute(
+                delete(SessionProduct).where(
+                    SessionProduct.phone_number == phone,
+                    SessionProduct.id.not_in(keep.scalar_subquery()),
+                )
+            )
+        if phones:
             self.db.commit()
+        return phones
+
+
+class AsyncProductSessionRepository:
+    """AsyncSession twin of ProductSessionRepository for the per-turn hot path."""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get(self, phone_number: str) -> ProductSession | None:
+        return (await self.db.execute(_header_stmt(phone_number))).scalars().first()
+
+    async def load_session(self, phone_number: str, context_limit: int) -> tuple[list[str], list[dict]]:
+        """See ProductSessionRepository.load_session."""
+        handles = list((await self.db.execute(_shown_handles_stmt(phone_number))).scalars())
+        recent: list[dict] = []
+        if context_limit > 0:
+            payloads = (await self.db.execute(_recent_payloads_stmt(phone_number, context_limit))).scalars()
+            recent = list(reversed(list(payloads)))
+        return handles, recent
+
+    async def append_products(
+        self,
+        phone_number: str,
+        new_products: list[dict],
+        commit: bool = True,
+    ) -> None:
+        """See ProductSessionRepository.append_products."""
+        now = datetime.now(timezone.utc)
+        dialect_name = self.db.get_bind().dialect.name
+
+        await self.db.execute(_touch_session_stmt(dialect_name, phone_number, now))
+        products = _dedup_products(new_products)
+        if products:
+            await self.db.execute(_upsert_products_stmt(dialect_name, phone_number, products, now))
+        if commit:
+            await self.db.commit()
+
+
+def migrate_legacy_sessions(db: Session) -> int:
+    """
+    One-time move of legacy products_json blobs into session_products.
+    Idempotent: migrated headers are reset to "[]", so re-running is a no-op.
+    Returns the number of phone numbers migrated.
+    """
+    stmt = select(ProductSession).where(
+        ProductSession.products_json.is_not(None),
+        ProductSession.products_json.not_in(["", "[]"]),
+    )
+    migrated = 0
+    for row in db.execute(stmt).scalars():
+        try:
+            products = json.loads(row.products_json or "[]")
+        except ValueError:
+            logger.warning(f"migrate_legacy_sessions — unreadable blob for phone={row.phone_number}, dropping it")
+            products = []
+
+        shown_at = row.updated_at or datetime.now(timezone.utc)
+        seen: set[str] = set()
+        for p in products:
+            handle = p.get("handle") or None
+            if handle:
+                if handle in seen:
+                    continue
+                seen.add(handle)
+            # Insertion order (id) preserves the original list order within shown_at
+            db.add(SessionProduct(
+                phone_number=row.phone_number,
+                handle=handle,
+                shown_at=shown_at,
+                payload=p,
+            ))
+        row.products_json = "[]"
+        migrated += 1
+
+    if migrated:
+        db.commit()
+        logger.info(f"migrate_legacy_sessions — moved {migrated} session blob(s) into session_products")
+    return migrated
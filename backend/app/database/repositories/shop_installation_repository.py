@@ -1,16 +1,192 @@
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+import threading
+import time
+from collections import OrderedDict
 
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.config.settings import settings
 from app.database.models.shop_installation import ShopInstallation
+from app.database.repositories.wa_qr_image_repository import AsyncWaQrImageRepository, WaQrImageRepository
 from app.utils.logger import get_logger
+from app.utils.metrics import metrics
 
 logger = get_logger(__name__)
 
+INSTALLATION_CACHE_LOOKUPS = metrics.counter(
+    "installation_cache_lookups_total", "ShopInstallation cache lookups by outcome.",
+    ["result"],
+)
+
+
+def _install_stmt(shop_domain: str, access_mode: str):
+    return select(ShopInstallation).where(
+        ShopInstallation.shop_domain == shop_domain,
+        ShopInstallation.access_mode == access_mode,
+    )
+
+
+def _by_shop_stmt(shop_domain: str):
+    return (
+        select(ShopInstallation)
+        .where(ShopInstallation.shop_domain == shop_domain)
+        .order_by(ShopInstallation.access_mode.asc())
+    )
+
+
+def _detached_copy(install: ShopInstallation) -> ShopInstallation:
+    """Column-only copy that belongs to no session, safe to share between requests."""
+    copy = ShopInstallation(**{
+        attr.key: getattr(install, attr.key) for attr in inspect(ShopInstallation).column_attrs
+    })
+    make_transient_to_detached(copy)
+    return copy
+
+
+def _pick_offline(installs: list[ShopInstallation]) -> ShopInstallation | None:
+    return next((i for i in installs if i.access_mode == "offline"), None)
+
+
+class InstallationCache:
+    """
+    Per-shop TTL cache of installation records, including "no installation" results.
+
+    Entries are detached copies — treat them as read-only. Writes made through the
+    repositories invalidate the shop; a lookup that raced with a write is not stored
+    (every invalidation bumps a generation counter the lookup captured beforehand).
+    """
+
+    def __init__(self):
+        self._entries: OrderedDict[str, tuple[float, tuple[ShopInstallation, ...]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.resolved_installation_cache_ttl_seconds > 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, shop_domain: str) -> list[ShopInstallation] | None:
+        """Cached records for the shop, or None on a miss."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(shop_domain)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(shop_domain)
+                INSTALLATION_CACHE_LOOKUPS.inc("hit")
+                return list(entry[1])
+            if entry is not None:
+                del self._entries[shop_domain]
+        INSTALLATION_CACHE_LOOKUPS.inc("miss")
+        return None
+
+    def put(self, shop_domain: str, installs: list[ShopInstallation], generation: int) -> None:
+        if not self.enabled:
+            return
+        copies = tuple(_detached_copy(i) for i in installs)
+        expires_at = time.monotonic() + settings.resolved_installation_cache_ttl_seconds
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[shop_domain] = (expires_at, copies)
+            self._entries.move_to_end(shop_domain)
+            while len(self._entries) > settings.installation_cache_max_shops:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, shop_domain: str) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(shop_domain, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+# Shared by the sync and async repositories
+installation_cache = InstallationCache()
+
+
+# ── Shared write logic (sync + async repositories) ────────────────────────────
+# Each repository method only loads, awaits the commit and refreshes; the field
+# assignment and branching live here.
+
+def _apply_upsert(
+    existing: ShopInstallation | None,
+    *,
+    shop_domain: str,
+    access_mode: str,
+    access_token: str,
+    scope: str | None,
+    associated_user_id: str | None,
+) -> ShopInstallation:
+    """Update the existing installation in place, or build a new one to add."""
+    action = "updating existing" if existing else "creating new"
+    logger.info(
+        "upsert — %s installation: shop=%s access_mode=%s scope=%s",
+        action,
+        shop_domain,
+        access_mode,
+        scope,
+    )
+    install = existing or ShopInstallation(shop_domain=shop_domain, access_mode=access_mode)
+    install.access_token = access_token
+    install.scope = scope
+    install.associated_user_id = associated_user_id
+    install.is_active = True
+    return install
+
+
+def _apply_provisioning(
+    install: ShopInstallation | None, shop_domain: str, wa_agent_id: str, wa_api_key: str, wa_status: str
+) -> bool:
+    if not install:
+        logger.warning("update_wa_provisioning — no offline install found for shop=%s", shop_domain)
+        return False
+    install.wa_agent_id = wa_agent_id
+    install.wa_api_key = wa_api_key
+    install.wa_status = wa_status
+    logger.info("update_wa_provisioning — saving agent for shop=%s agent_id=%s", shop_domain, wa_agent_id)
+    return True
+
+
+def _apply_status(
+    install: ShopInstallation | None, shop_domain: str, wa_status: str, wa_phone_number: str | None
+) -> bool:
+    if not install:
+        return False
+    install.wa_status = wa_status
+    if wa_phone_number is not None:
+        install.wa_phone_number = wa_phone_number
+    logger.info("update_wa_status — shop=%s status=%s phone=%s", shop_domain, wa_status, wa_phone_number)
+    return True
+
+
+def _apply_qr_hash(install: ShopInstallation, shop_domain: str, content_hash: str | None) -> bool:
+    """Point the install at its stored QR image; False if the payload couldn't be decoded."""
+    if content_hash is None:
+        return False
+    install.wa_qr_hash = content_hash
+    logger.info("update_wa_qr_code — shop=%s qr_hash=%s", shop_domain, content_hash[:12])
+    return True
+
 
 class ShopInstallationRepository:
     def __init__(self, db: Session):
         self.db = db
 
+    def _commit(self, shop_domain: str, install: ShopInstallation) -> ShopInstallation:
+        self.db.commit()
+        installation_cache.invalidate(shop_domain)
+        self.db.refresh(install)
+        return install
+
     def upsert(
         self,
         *,
@@ -20,68 +196,44 @@ class ShopInstallationRepository:
         scope: str | None,
         associated_user_id: str | None,
     ) -> ShopInstallation:
-        stmt = select(ShopInstallation).where(
-            ShopInstallation.shop_domain == shop_domain,
-            ShopInstallation.access_mode == access_mode,
-        )
-        existing = self.db.execute(stmt).scalar_one_or_none()
-
-        if existing:
-            logger.info(
-                "upsert — updating existing installation: shop=%s access_mode=%s scope=%s",
-                shop_domain,
-                access_mode,
-                scope,
-            )
-            existing.access_token = access_token
-            existing.scope = scope
-            existing.associated_user_id = associated_user_id
-            existing.is_active = True
-            self.db.add(existing)
-            self.db.commit()
-            self.db.refresh(existing)
-            logger.debug("upsert — update committed for shop=%s access_mode=%s", shop_domain, access_mode)
-            return existing
-
-        logger.info(
-            "upsert — creating new installation: shop=%s access_mode=%s scope=%s",
-            shop_domain,
-            access_mode,
-            scope,
-        )
-        installation = ShopInstallation(
+        existing = self.db.execute(_install_stmt(shop_domain, access_mode)).scalar_one_or_none()
+        install = _apply_upsert(
+            existing,
             shop_domain=shop_domain,
             access_mode=access_mode,
             access_token=access_token,
             scope=scope,
             associated_user_id=associated_user_id,
-            is_active=True,
         )
-        self.db.add(installation)
-        self.db.commit()
-        self.db.refresh(installation)
-        logger.debug("upsert — insert committed for shop=%s access_mode=%s", shop_domain, access_mode)
-        return installation
+        self.db.add(install)
+        return self._commit(shop_domain, install)
 
     def get_by_shop(self, shop_domain: str) -> list[ShopInstallation]:
-        stmt = (
-            select(ShopInstallation)
-            .where(ShopInstallation.shop_domain == shop_domain)
-            .order_by(ShopInstallation.access_mode.asc())
-        )
-        results = list(self.db.execute(stmt).scalars().all())
+        """All installations for a shop, served from installation_cache when fresh."""
+        cached = installation_cache.get(shop_domain)
+        if cached is not None:
+            logger.debug("get_by_shop — cache hit shop=%s records_returned=%d", shop_domain, len(cached))
+            return cached
+        generation = installation_cache.generation
+        results = list(self.db.execute(_by_shop_stmt(shop_domain)).scalars().all())
+        installation_cache.put(shop_domain, results, generation)
         logger.debug(
             "get_by_shop — shop=%s records_returned=%d", shop_domain, len(results)
         )
         return results
 
-    def get_offline_by_shop(self, shop_domain: str) -> ShopInstallation | None:
-        """Return the single offline-mode installation for a shop (most common lookup)."""
-        stmt = select(ShopInstallation).where(
-            ShopInstallation.shop_domain == shop_domain,
-            ShopInstallation.access_mode == "offline",
-        )
-        return self.db.execute(stmt).scalar_one_or_none()
+    def get_offline_by_shop(self, shop_domain: str, use_cache: bool = True) -> ShopInstallation | None:
+        """
+        Return the single offline-mode installation for a shop (most common lookup).
+        use_cache=False reads the database, for screens that must not lag other workers' writes.
+        """
+        if not use_cache:
+            return self._load_offline(shop_domain)
+        return _pick_offline(self.get_by_shop(shop_domain))
+
+    def _load_offline(self, shop_domain: str) -> ShopInstallation | None:
+        """Uncached, session-attached load for the update helpers."""
+        return self.db.execute(_install_stmt(shop_domain, "offline")).scalar_one_or_none()
 
     # ── WhatsApp helpers ───────────────────────────────────────────────────────
 
@@ -94,17 +246,10 @@ class ShopInstallationRepository:
         wa_status: str = "INACTIVE",
     ) -> ShopInstallation | None:
         """Save agentId + apiKey returned by the WA Platform provisioning call."""
-        install = self.get_offline_by_shop(shop_domain)
-        if not install:
-            logger.warning("update_wa_provisioning — no offline install found for shop=%s", shop_domain)
+        install = self._load_offline(shop_domain)
+        if not _apply_provisioning(install, shop_domain, wa_agent_id, wa_api_key, wa_status):
             return None
-        install.wa_agent_id = wa_agent_id
-        install.wa_api_key = wa_api_key
-        install.wa_status = wa_status
-        self.db.commit()
-        self.db.refresh(install)
-        logger.info("update_wa_provisioning — saved agent for shop=%s agent_id=%s", shop_domain, wa_agent_id)
-        return install
+        return self._commit(shop_domain, install)
 
     def update_wa_status(
         self,
@@ -114,16 +259,10 @@ class ShopInstallationRepository:
         wa_phone_number: str | None = None,
     ) -> ShopInstallation | None:
         """Update WhatsApp connection status (called from /status webhook)."""
-        install = self.get_offline_by_shop(shop_domain)
-        if not install:
+        install = self._load_offline(shop_domain)
+        if not _apply_status(install, shop_domain, wa_status, wa_phone_number):
             return None
-        install.wa_status = wa_status
-        if wa_phone_number is not None:
-            install.wa_phone_number = wa_phone_number
-        self.db.commit()
-        self.db.refresh(install)
-        logger.info("update_wa_status — shop=%s status=%s phone=%s", shop_domain, wa_status, wa_phone_number)
-        return install
+        return self._commit(shop_domain, install)
 
     def update_wa_qr_code(
         self,
@@ -131,13 +270,113 @@ class ShopInstallationRepository:
         shop_domain: str,
         wa_qr_code: str,
     ) -> ShopInstallation | None:
-        """Overwrite the stored QR code (called from /qr webhook)."""
-        install = self.get_offline_by_shop(shop_domain)
+        """Replace the shop's QR image with a data URI (called from /qr webhook)."""
+        install = self._load_offline(shop_domain)
         if not install:
             return None
-        install.wa_qr_code = wa_qr_code
-        self.db.commit()
-        self.db.refresh(install)
-        logger.info("update_wa_qr_code — shop=%s qr_updated=True", shop_domain)
+        content_hash = WaQrImageRepository(self.db).save(shop_domain, wa_qr_code)
+        if not _apply_qr_hash(install, shop_domain, content_hash):
+            return install
+        return self._commit(shop_domain, install)
+
+
+class AsyncShopInstallationRepository:
+    """AsyncSession twin of ShopInstallationRepository for async route handlers."""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def _commit(self, shop_domain: str, install: ShopInstallation) -> ShopInstallation:
+        await self.db.commit()
+        installation_cache.invalidate(shop_domain)
+        await self.db.refresh(install)
         return install
 
+    async def upsert(
+        self,
+        *,
+        shop_domain: str,
+        access_mode: str,
+        access_token: str,
+        scope: str | None,
+        associated_user_id: str | None,
+    ) -> ShopInstallation:
+        existing = (await self.db.execute(_install_stmt(shop_domain, access_mode))).scalar_one_or_none()
+        install = _apply_upsert(
+            existing,
+            shop_domain=shop_domain,
+            access_mode=access_mode,
+            access_token=access_token,
+            scope=scope,
+            associated_user_id=associated_user_id,
+        )
+        self.db.add(install)
+        return await self._commit(shop_domain, install)
+
+    async def get_by_shop(self, shop_domain: str) -> list[ShopInstallation]:
+        """All installations for a shop, served from installation_cache when fresh."""
+        cached = installation_cache.get(shop_domain)
+        if cached is not None:
+            logger.debug("get_by_shop — cache hit shop=%s records_returned=%d", shop_domain, len(cached))
+            return cached
+        generation = installation_cache.generation
+        results = list((await self.db.execute(_by_shop_stmt(shop_domain))).scalars().all())
+        installation_cache.put(shop_domain, results, generation)
+        logger.debug(
+            "get_by_shop — shop=%s records_returned=%d", shop_domain, len(results)
+        )
+        return results
+
+    async def get_offline_by_shop(self, shop_domain: str, use_cache: bool = True) -> ShopInstallation | None:
+        """See ShopInstallationRepository.get_offline_by_shop."""
+        if not use_cache:
+            return await self._load_offline(shop_domain)
+        return _pick_offline(await self.get_by_shop(shop_domain))
+
+    async def _load_offline(self, shop_domain: str) -> ShopInstallation | None:
+        """Uncached, session-attached load for the update helpers."""
+        return (await self.db.execute(_install_stmt(shop_domain, "offline"))).scalar_one_or_none()
+
+    # ── WhatsApp helpers ───────────────────────────────────────────────────────
+
+    async def update_wa_provisioning(
+        self,
+        *,
+        shop_domain: str,
+        wa_agent_id: str,
+        wa_api_key: str,
+        wa_status: str = "INACTIVE",
+    ) -> ShopInstallation | None:
+        """Save agentId + apiKey returned by the WA Platform provisioning call."""
+        install = await self._load_offline(shop_domain)
+        if not _apply_provisioning(install, shop_domain, wa_agent_id, wa_api_key, wa_status):
+            return None
+        return await self._commit(shop_domain, install)
+
+    async def update_wa_status(
+        self,
+        *,
+        shop_domain: str,
+        wa_status: str,
+        wa_phone_number: str | None = None,
+    ) -> ShopInstallation | None:
+        """Update WhatsApp connection status (called from /status webhook)."""
+        install = await self._load_offline(shop_domain)
+        if not _apply_status(install, shop_domain, wa_status, wa_phone_number):
+            return None
+        return await self._commit(shop_domain, install)
+
+    async def update_wa_qr_code(
+        self,
+        *,
+        shop_domain: str,
+        wa_qr_code: str,
+    ) -> ShopInstallation | None:
+        """Replace the shop's QR image with a data URI (called from /qr webhook)."""
+        install = await self._load_offline(shop_domain)
+        if not install:
+            return None
+        content_hash = await AsyncWaQrImageRepository(self.db).save(shop_domain, wa_qr_code)
+        if not _apply_qr_hash(install, shop_domain, content_hash):
+            return install
+        return await self._commit(shop_domain, install)
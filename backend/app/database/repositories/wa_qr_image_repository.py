@@ -0,0 +1,129 @@
+"""
+WhatsApp QR Image Repository
+────────────────────────────
+Stores the QR data URIs pushed by the WA Platform as decoded bytes in
+wa_qr_images, keyed by content hash, and loads them back for the image
+endpoint. Writes are a single upsert on shop_domain, so concurrent /qr webhooks
+for one shop can't both insert, and don't commit — the caller commits them
+together with the installation's wa_qr_hash.
+"""
+import base64
+import binascii
+import hashlib
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.database.models.shop_installation import ShopInstallation
+from app.database.models.wa_qr_image import WaQrImage
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def decode_qr_data_uri(data_uri: str) -> tuple[str, bytes] | None:
+    """
+    Split a data URI ("data:image/png;base64,....") into (mime_type, bytes).
+    A bare base64 string is taken as PNG. Returns None if it can't be decoded.
+    """
+    mime_type = "image/png"
+    encoded = data_uri.strip()
+    if encoded.startswith("data:"):
+        header, _, encoded = encoded.partition(",")
+        mime_type = header[len("data:"):].split(";")[0] or mime_type
+    try:
+        data = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return (mime_type, data) if data else None
+
+
+def qr_content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+# ── Shared query building (sync + async repositories) ─────────────────────────
+
+def _by_hash_stmt(content_hash: str):
+    return select(WaQrImage).where(WaQrImage.content_hash == content_hash).limit(1)
+
+
+def _insert_for(dialect_name: str):
+    """INSERT construct with ON CONFLICT support for the session's backend."""
+    return pg_insert if dialect_name == "postgresql" else sqlite_insert
+
+
+def _upsert_image_stmt(dialect_name: str, shop_domain: str, content_hash: str, mime_type: str, data: bytes):
+    """Insert the shop's row, or overwrite it in place."""
+    stmt = _insert_for(dialect_name)(WaQrImage).values(
+        shop_domain=shop_domain, content_hash=content_hash, mime_type=mime_type, data=data,
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["shop_domain"],
+        set_={"content_hash": content_hash, "mime_type": mime_type, "data": data},
+    )
+
+
+class WaQrImageRepository:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def save(self, shop_domain: str, data_uri: str) -> str | None:
+        """Stage the shop's QR image; returns its content hash (None if undecodable)."""
+        decoded = decode_qr_data_uri(data_uri)
+        if decoded is None:
+            logger.warning("save — undecodable QR payload for shop=%s (length=%d)", shop_domain, len(data_uri))
+            return None
+        mime_type, data = decoded
+        content_hash = qr_content_hash(data)
+        dialect_name = self.db.get_bind().dialect.name
+        self.db.execute(_upsert_image_stmt(dialect_name, shop_domain, content_hash, mime_type, data))
+        return content_hash
+
+    def get_by_hash(self, content_hash: str) -> WaQrImage | None:
+        return self.db.execute(_by_hash_stmt(content_hash)).scalar_one_or_none()
+
+
+class AsyncWaQrImageRepository:
+    """AsyncSession twin of WaQrImageRepository for async route handlers."""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def save(self, shop_domain: str, data_uri: str) -> str | None:
+        """Stage the shop's QR image; returns its content hash (None if undecodable)."""
+        decoded = decode_qr_data_uri(data_uri)
+        if decoded is None:
+            logger.warning("save — undecodable QR payload for shop=%s (length=%d)", shop_domain, len(data_uri))
+            return None
+        mime_type, data = decoded
+        content_hash = qr_content_hash(data)
+        dialect_name = self.db.get_bind().dialect.name
+        await self.db.execute(_upsert_image_stmt(dialect_name, shop_domain, content_hash, mime_type, data))
+        return content_hash
+
+    async def get_by_hash(self, content_hash: str) -> WaQrImage | None:
+        return (await self.db.execute(_by_hash_stmt(content_hash))).scalar_one_or_none()
+
+
+def migrate_legacy_qr_codes(db: Session) -> int:
+    """
+    One-time move of inline QR data URIs (the old wa_qr_code values) into wa_qr_images.
+    Idempotent: migrated rows hold a content hash, which is never a data URI, and
+    each image goes through the same upsert as save().
+    Returns the number of installations migrated.
+    """
+    stmt = select(ShopInstallation).where(ShopInstallation.wa_qr_hash.like("data:%"))
+    repo = WaQrImageRepository(db)
+    migrated = 0
+    for install in db.execute(stmt).scalars():
+        install.wa_qr_hash = repo.save(install.shop_domain, install.wa_qr_hash)
+        migrated += 1
+
+    if migrated:
+        db.commit()
+        logger.info("migrate_legacy_qr_codes — moved %d QR code(s) into wa_qr_images", migrated)
+    return migrated
@@ -1,23 +1,44 @@
+import asyncio
 import logging
 import sys
+from contextlib import asynccontextmanager
 
 from fastapi import BackgroundTasks, Depends, FastAPI, Request
 from fastapi.responses import HTMLResponse, RedirectResponse, Response
 
 from app.config.settings import settings
-from app.database.engine import Base, engine, get_db
+from app.database.engine import (
+    Base,
+    SessionLocal,
+    dispose_async_engine,
+    engine,
+    get_async_db,
+    safe_database_url,
+)
 from app.database.models import ShopInstallation  # noqa: F401
 from app.database.models.product_session import ProductSession  # noqa: F401
-from app.database.repositories.shop_installation_repository import ShopInstallationRepository
+from app.database.models.session_product import SessionProduct  # noqa: F401
+from app.database.models.wa_qr_image import WaQrImage  # noqa: F401
+from app.database.repositories.product_session_repository import migrate_legacy_sessions
+from app.database.repositories.shop_installation_repository import AsyncShopInstallationRepository
+from app.database.repositories.wa_qr_image_repository import migrate_legacy_qr_codes
 from app.middleware.request_logging import log_requests_middleware
 from app.routes.auth_routes import router as auth_router
 from app.routes.data_routes import router as data_router
+from app.routes.metrics_routes import router as metrics_router
 from app.routes.whatsapp_routes import router as whatsapp_router
+from app.services.agent_events import agent_event_broker
+from app.services.async_search_client import async_search_client
+from app.services.embedding_service import embedding_service
+from app.services.image_transform import image_transformer
+from app.services.product_session_service import product_session_service
+from app.services.search_service import search_service
 from app.services.shopify_auth_service import shopify_auth_service
+from app.utils.http_clients import http_clients
 from app.utils.logger import get_logger
 from app.utils.security import verify_shopify_hmac
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 def _configure_logging() -> None:
@@ -53,6 +74,25 @@ def _configure_logging() -> None:
         logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
 
 
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    """Start-up / shutdown hooks for long-lived clients and background workers."""
+    # Resolve (or create) the products index once so queries reuse the cached handle
+    await asyncio.to_thread(search_service.ensure_index, settings.meilisearch_index)
+    product_session_service.start()
+    agent_event_broker.start()
+    yield
+    # End open agent-event streams so the server can shut down
+    agent_event_broker.close()
+    # Write buffered product sessions before the clients go away
+    await product_session_service.stop()
+    await embedding_service.aclose()
+    image_transformer.shutdown()
+    await async_search_client.aclose()
+    await http_clients.aclose()
+    await dispose_async_engine()
+
+
 def create_app() -> FastAPI:
     _configure_logging()
 
@@ -60,12 +100,15 @@ def create_app() -> FastAPI:
     logger.info(
         "Starting Shopify Auth Backend — log_level=%s, db=%s",
         settings.log_level.upper(),
-        settings.sqlite_url,
+        safe_database_url(),
     )
 
-    app = FastAPI(title="Shopify Auth Backend", version="0.1.0")
+    app = FastAPI(title="Shopify Auth Backend", version="0.1.0", lifespan=_lifespan)
     Base.metadata.create_all(bind=engine)
     logger.info("Database tables verified / created.")
+    with SessionLocal() as db:
+        migrate_legacy_sessions(db)
+        migrate_legacy_qr_codes(db)
 
     app.middleware("http")(log_requests_middleware)
     logger.debug("Request-logging middleware registered.")
@@ -75,7 +118,7 @@ def create_app() -> FastAPI:
         return {"status": "ok"}
 
     @app.get("/", response_model=None)
-    async def root(request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)) -> Response:
+    async def root(request: Request, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_async_db)) -> Response:
         """Smart entry-point that handles two distinct Shopify request types:
 
         1. Install trigger (from App Store / install link):
@@ -118,8 +161,8 @@ def create_app() -> FastAPI:
         api_key  = settings.shopify_api_key
 
         if shop and id_token:
-            repo = ShopInstallationRepository(db)
-            existing = repo.get_by_shop(shop)
+            repo = AsyncShopInstallationRepository(db)
+            existing = await repo.get_by_shop(shop)
             if not existing:
                 # First visit — no token in DB yet. Exchange now.
                 logger.info("root — no token found for shop=%s, triggering token exchange", shop)
@@ -524,7 +567,12 @@ def create_app() -> FastAPI:
                 <!-- WhatsApp connection logic -->
                 <script>
                     const SHOP = "{shop}";
+                    const POLL_MS      = 5000;
+                    const LIVE_POLL_MS = {int(settings.agent_events_live_poll_seconds * 1000)};
                     let pollInterval = null;
+                    let pollMs       = 0;
+                    let eventSource  = null;
+                    let eventsLive   = false;
 
                     // ── Render state ──────────────────────────────────────────
                     function renderStatus(state) {{
@@ -567,8 +615,12 @@ def create_app() -> FastAPI:
                                 statusText.textContent = 'Waiting for QR Scan';
                                 btn.disabled = true;
                                 btnText.textContent = '📷 Scan QR Code Below';
-                                if (state.wa_qr_code) {{
-                                    qrImg.src = state.wa_qr_code;
+                                if (state.wa_qr_url) {{
+                                    // Only swap the image when the QR actually changed
+                                    if (qrImg.dataset.hash !== state.wa_qr_hash) {{
+                                        qrImg.src = state.wa_qr_url;
+                                        qrImg.dataset.hash = state.wa_qr_hash;
+                                    }}
                                     qrPanel.style.display = 'block';
                                 }}
                                 startPolling();
@@ -652,16 +704,39 @@ def create_app() -> FastAPI:
                     }}
 
                     function startPolling() {{
-                        if (pollInterval) return;
-                        pollInterval = setInterval(pollStatus, 5000);
+                        // Fast while the event stream is down. While it's live, keep a slow poll:
+                        // a webhook handled by another worker never reaches this stream.
+                        const ms = eventsLive ? LIVE_POLL_MS : POLL_MS;
+                        if (pollInterval && pollMs === ms) return;
+                        stopPolling();
+                        if (!ms) return;
+                        pollInterval = setInterval(pollStatus, ms);
+                        pollMs = ms;
                     }}
 
                     function stopPolling() {{
                         if (pollInterval) {{ clearInterval(pollInterval); pollInterval = null; }}
                     }}
 
-                    // ── On load: fetch current status ─────────────────────────
-                    if (SHOP) pollStatus();
+                    // ── Server push (SSE) ─────────────────────────────────────
+                    function startEvents() {{
+                        if (!window.EventSource || eventSource) return false;
+                        eventSource = new EventSource('/api/whatsapp/agent-events?shop=' + encodeURIComponent(SHOP));
+                        eventSource.addEventListener('agent-status', (e) => renderStatus(JSON.parse(e.data)));
+                        eventSource.onopen = () => {{
+                            eventsLive = true;
+                            if (pollInterval) startPolling();   // drop to the slow rate
+                        }};
+                        eventSource.onerror = () => {{
+                            // EventSource reconnects by itself; poll fast until it does
+                            eventsLive = false;
+                            startPolling();
+                        }};
+                        return true;
+                    }}
+
+                    // ── On load: stream status, or fetch it once if SSE is unavailable ──
+                    if (SHOP && !startEvents()) pollStatus();
                 </script>
 
                 <!-- Product Sync logic -->
@@ -787,7 +862,7 @@ def create_app() -> FastAPI:
             status_code=200,
         )
 
-    app.include_router(auth_router, prefix="/auth", tags=["auth"])
+    app.include_router(auth_router)
     logger.info("Auth router mounted at /auth.")
 
     app.include_router(data_router, tags=["data"])
@@ -796,6 +871,9 @@ def create_app() -> FastAPI:
     app.include_router(whatsapp_router)
     logger.info("WhatsApp webhook router mounted at /api/whatsapp.")
 
+    app.include_router(metrics_router)
+    logger.info("Metrics router mounted at /metrics.")
+
     return app
 
 
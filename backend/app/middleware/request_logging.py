@@ -7,6 +7,7 @@ from collections.abc import Callable
 from fastapi import Request, Response
 
 from app.config.settings import settings
+from app.utils.metrics import HTTP_LATENCY, HTTP_REQUESTS
 
 request_logger = logging.getLogger("app.request")
 
@@ -19,7 +20,7 @@ _SENSITIVE_HEADER_KEYS = {
 }
 
 # Paths that are too chatty to log at INFO (health checks, etc.)
-_LOW_NOISE_PATHS = {"/health"}
+_LOW_NOISE_PATHS = {"/health", "/metrics", "/metrics/pipeline"}
 
 
 def _mask_value(value: str) -> str:
@@ -38,6 +39,12 @@ def _sanitize_headers(headers: dict[str, str]) -> dict[str, str]:
     return sanitized
 
 
+def _route_label(request: Request) -> str:
+    """Route template (e.g. /auth/shops/{shop}) so metric label cardinality stays bounded."""
+    route = request.scope.get("route")
+    return getattr(route, "path_format", None) or "unmatched"
+
+
 def _log_as_json(logger: logging.Logger, level: int, data: dict) -> None:
     """Emit *data* as a compact JSON string at the given log *level*."""
     logger.log(level, json.dumps(data, ensure_ascii=True))
@@ -82,7 +89,11 @@ async def log_requests_middleware(request: Request, call_next: Callable) -> Resp
     try:
         response = await call_next(request)
     except Exception:
-        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        elapsed = time.perf_counter() - started
+        duration_ms = round(elapsed * 1000, 2)
+        route = _route_label(request)
+        HTTP_REQUESTS.inc(request.method, route, "500")
+        HTTP_LATENCY.observe(elapsed, request.method, route)
         request_logger.exception(
             json.dumps(
                 {
@@ -97,7 +108,11 @@ async def log_requests_middleware(request: Request, call_next: Callable) -> Resp
         )
         raise
 
-    duration_ms = round((time.perf_counter() - started) * 1000, 2)
+    elapsed = time.perf_counter() - started
+    duration_ms = round(elapsed * 1000, 2)
+    route = _route_label(request)
+    HTTP_REQUESTS.inc(request.method, route, str(response.status_code))
+    HTTP_LATENCY.observe(elapsed, request.method, route)
     completed_level = logging.DEBUG if is_low_noise else logging.INFO
 
     _log_as_json(
@@ -1,17 +1,19 @@
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, UploadFile, File, Form
 from fastapi.responses import HTMLResponse, JSONResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 import io
 import json
+import time
 from openai import AsyncOpenAI
 
 from app.config.settings import settings
-from app.database.engine import get_db
-from app.database.repositories.shop_installation_repository import ShopInstallationRepository
+from app.database.engine import get_async_db
+from app.database.repositories.shop_installation_repository import AsyncShopInstallationRepository
 from app.services.shopify_service import ShopifyService
 from app.services.embedding_service import embedding_service
 from app.services.search_service import search_service
+from app.utils.metrics import BACKGROUND_TASKS, OPENAI_LATENCY, record_openai_usage
 from app.prompts.whatsapp_prompts import SEARCH_TOOL_SCHEMA, SYSTEM_PROMPT
 from app.templates import (
     DASHBOARD_HTML,
@@ -53,7 +55,7 @@ async def api_visualize_search(
 
     # 1. Text Embedding
     if query:
-        text_vector = embedding_service.embed_text(query)
+        text_vector = await embedding_service.embed_text_async(query)
 
     # 3. Build optional filter string
     filters = []
@@ -64,7 +66,7 @@ async def api_visualize_search(
     filter_str = " AND ".join(filters) if filters else None
 
     # 3. Hybrid Search
-    results = search_service.perform_hybrid_search(
+    results = await search_service.perform_hybrid_search_async(
         query=query,
         text_vector=text_vector,
         limit=limit,
@@ -93,6 +95,7 @@ async def api_ai_visualize_search(request: Request):
 
     # ── Step 1: Force LLM tool call ─────────────────────────────────────────
     try:
+        started = time.perf_counter()
         ai_response = await _ai_client.chat.completions.create(
             model=settings.chat_model,
             messages=[
@@ -104,6 +107,8 @@ async def api_ai_visualize_search(request: Request):
             max_tokens=300,
             temperature=0,
         )
+        OPENAI_LATENCY.observe(time.perf_counter() - started, "chat")
+        record_openai_usage("chat", ai_response.usage)
         tool_call = ai_response.choices[0].message.tool_calls[0]
         ai_args   = json.loads(tool_call.function.arguments)
         usage     = ai_response.usage
@@ -124,13 +129,13 @@ async def api_ai_visualize_search(request: Request):
     filter_str = " AND ".join(filters) if filters else None
 
     try:
-        text_vector = embedding_service.embed_text(search_query)
+        text_vector = await embedding_service.embed_text_async(search_query)
     except Exception:
         text_vector = None
 
     # ── Step 3: Hybrid search ────────────────────────────────────────────────
     try:
-        results = search_service.perform_hybrid_search(
+        results = await search_service.perform_hybrid_search_async(
             query=search_query,
             text_vector=text_vector,
             limit=limit,
@@ -156,10 +161,10 @@ async def api_ai_visualize_search(request: Request):
     }
 
 @router.get("/dashboard", response_class=HTMLResponse)
-async def dashboard(shop: str, db: Session = Depends(get_db)):
+async def dashboard(shop: str, db: AsyncSession = Depends(get_async_db)):
     # 1. Get Token from DB
-    repo = ShopInstallationRepository(db)
-    installation = repo.get_by_shop(shop)
+    repo = AsyncShopInstallationRepository(db)
+    installation = await repo.get_by_shop(shop)
     
     if not installation:
         return HTMLResponse(content=f"<h1>Error: No installation found for shop: {shop}</h1>", status_code=404)
@@ -200,13 +205,13 @@ async def dashboard(shop: str, db: Session = Depends(get_db)):
 # ── Product Sync Endpoints ─────────────────────────────────────────────────────
 
 @router.post("/api/products/sync")
-async def sync_products(background_tasks: BackgroundTasks, shop: str, db: Session = Depends(get_db)):
+async def sync_products(background_tasks: BackgroundTasks, shop: str, db: AsyncSession = Depends(get_async_db)):
     """
     Trigger background ingestion of all products for a shop into Meilisearch.
     Returns immediately with 202 Accepted.
     """
-    repo = ShopInstallationRepository(db)
-    installation = repo.get_by_shop(shop)
+    repo = AsyncShopInstallationRepository(db)
+    installation = await repo.get_by_shop(shop)
     if not installation:
         raise HTTPException(status_code=404, detail=f"Shop not found: {shop}")
 
@@ -220,11 +225,19 @@ async def sync_products(background_tasks: BackgroundTasks, shop: str, db: Sessio
 
     # Clear old status and kick off background task
     SYNC_STATUS[shop] = {"status": "fetching", "total": 0, "done": 0, "error": ""}
-    background_tasks.add_task(ingest_products, shop_domain=shop)
+    BACKGROUND_TASKS.inc("product_sync")
+    background_tasks.add_task(_run_product_sync, shop)
 
     return JSONResponse(status_code=202, content={"detail": "Product sync started.", "shop": shop})
 
 
+async def _run_product_sync(shop: str):
+    try:
+        await ingest_products(shop_domain=shop)
+    finally:
+        BACKGROUND_TASKS.dec("product_sync")
+
+
 @router.get("/api/products/sync-status")
 async def sync_status(shop: str):
     """
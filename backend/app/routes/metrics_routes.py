@@ -0,0 +1,30 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from app.utils.metrics import metrics
+from app.utils.timing import latency_histograms
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("")
+def prometheus_metrics() -> Response:
+    """
+    Prometheus text exposition format: HTTP request counts/latency per route,
+    OpenAI latency and token usage, Meilisearch latency, embedding cache hit
+    rates, background tasks in flight and pipeline span histograms.
+    """
+    return Response(content=metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@router.get("/pipeline")
+def pipeline_latency() -> dict:
+    """
+    In-process latency histograms for the WhatsApp message pipeline.
+    One entry per span name (signature_verification, session_read, llm_first_call,
+    embedding, search.<stage>, session_write, llm_second_call, dispatch, ...)
+    with count, mean and p50/p95/p99/max in milliseconds.
+    """
+    return {"spans": latency_histograms.snapshot()}
@@ -2,18 +2,31 @@ import asyncio
 import hashlib
 import hmac
 import json
+from typing import NamedTuple, Optional
 
 import httpx
-from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-import base64
 
 from app.config.settings import settings
-from app.database.engine import get_db
-from app.database.repositories.shop_installation_repository import ShopInstallationRepository
+from app.database.engine import AsyncSessionLocal, get_async_db, get_db
+from app.database.models.shop_installation import ShopInstallation
+from app.database.repositories.shop_installation_repository import (
+    AsyncShopInstallationRepository,
+    ShopInstallationRepository,
+)
+from app.database.repositories.wa_qr_image_repository import AsyncWaQrImageRepository
+from app.utils.http_clients import http_clients
 from app.utils.logger import get_logger
+from app.utils.metrics import BACKGROUND_TASKS, DISPATCH_IMAGE_BYTES_SAVED
 from app.utils.retry import retry_async
+from app.utils.timing import MessageTrace, start_trace
+from app.services.agent_events import agent_event_broker
 from app.services.ai_service import ai_service
+from app.services.image_cache import normalize_image_url
+from app.services.image_transform import fetch_dispatch_image, image_transformer
 
 router = APIRouter(prefix="/api/whatsapp", tags=["whatsapp"])
 logger = get_logger(__name__)
@@ -36,118 +49,211 @@ def verify_wa_signature(raw_body: bytes, signature: str, secret: str) -> bool:
     # Use compare_digest to prevent timing attacks
     return hmac.compare_digest(expected, signature)
 
-async def send_product_messages(api_key: str, phone_number: str, products: list):
+async def send_product_messages(
+    api_key: str,
+    phone_number: str,
+    products: list,
+    trace: Optional[MessageTrace] = None,
+):
     """
     Background task to send up to 3 separate API calls for each product.
     Resolves the image to a base64 string and formats the text per product.
+    If the message's trace is passed in, the dispatch is timed and the trace finished here.
     """
+    if trace is None:
+        await _dispatch_products(api_key, phone_number, products)
+        return
+    try:
+        with trace.span("dispatch"):
+            await _dispatch_products(api_key, phone_number, products)
+    finally:
+        trace.finish()
+
+
+class _CardImage(NamedTuple):
+    mime_type: str
+    b64_data: str
+    filename: str
+    bytes_saved: int = 0    # Versus the original download, when the transform stage shrank it
+
+
+_download_slots: Optional[tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+
+
+def _image_download_slots() -> asyncio.Semaphore:
+    """Process-wide cap on concurrent image downloads (one semaphore per running loop)."""
+    global _download_slots
+    loop = asyncio.get_running_loop()
+    if _download_slots is None or _download_slots[0] is not loop:
+        _download_slots = (loop, asyncio.Semaphore(max(1, settings.product_image_download_concurrency)))
+    return _download_slots[1]
+
+
+async def _fetch_card_image(client: httpx.AsyncClient, product: dict, tag: str) -> Optional[_CardImage]:
+    """Base64 a product image (via the image cache); None if it has no image or the download fails."""
+    title     = product.get("title", "Product")
+    handle    = product.get("handle", "")
+    image_url = normalize_image_url(product.get("image_url"))
+
+    # ── Guard: image_url required ────────────────────────────────────────────
+    if not image_url:
+        logger.warning(f"  {tag} ⚠️  Skipped — no image_url for product: {title!r}")
+        return None
+
+    # ── Download image (or reuse the cached copy) → retry on transient errors ──
+    try:
+        async with _image_download_slots():
+            image = await fetch_dispatch_image(
+                client,
+                image_url,
+                attempts=settings.product_image_download_attempts,
+                label=f"image-download [{title!r}]",
+            )
+        ext      = image.mime_type.split("/")[-1]   # "jpeg", "png", "webp", etc.
+        filename = f"{handle}.{ext}" if handle else f"product.{ext}"
+        saved = f" (saved {image.bytes_saved:,})" if image.bytes_saved else ""
+        logger.info(f"  {tag} 🖼️  Image ready — mime={image.mime_type} size={len(image.data):,} bytes{saved}")
+        return _CardImage(image.mime_type, image.base64(), filename, image.bytes_saved)
+    except Exception as e:
+        logger.error(f"  {tag} ❌ Image download FAILED for {title!r} | url={image_url} | error={e}")
+        return None
+
+
+async def _send_card(
+    client: httpx.AsyncClient,
+    send_url: str,
+    api_key: str,
+    phone_number: str,
+    product: dict,
+    image: _CardImage,
+    tag: str,
+) -> bool:
+    """POST one product card to the WA Platform; True if it was accepted."""
+    title  = product.get("title", "Product")
+    handle = product.get("handle", "")
+    price  = product.get("price", "N/A")
+
+    # ── Build payload ────────────────────────────────────────────────────────
+    # Per API spec: `caption` inside the media object is what renders
+    # as text beneath the image in WhatsApp. Putting text in top-level
+    # `content` alongside a `media` object causes the image to be sent
+    # as a raw file/document instead of an inline picture.
+    url     = f"https://ismailsclothing.com/products/{handle}"
+    caption = f"*{title}*\n\n*PKR {price}*\n\n{url}"
+
+    payload = {
+        "phoneNumber": phone_number,
+        "content": caption,     # required non-empty field by the API
+        "media": {
+            "type":     image.mime_type,  # e.g. "image/jpeg", "image/png"
+            "data":     image.b64_data,
+            "filename": image.filename,   # e.g. "bu25116-beg.jpeg"
+            "caption":  caption,   # renders as text beneath the image in WhatsApp
+        }
+    }
+    headers = {
+        "x-api-key": api_key,
+        "Content-Type": "application/json",
+    }
+
+    # ── POST to WA Platform → retry on transient errors ──────────────────────
+    # Only retry on network/timeout errors. 4xx responses (bad request,
+    # auth) are not retried since they won't change on a retry.
+    try:
+        res = await retry_async(
+            lambda: client.post(send_url, json=payload, headers=headers),
+            retries=settings.product_send_attempts,
+            delay=1.0,
+            exceptions=(httpx.RequestError, httpx.TimeoutException),
+            label=f"WA send-product [{title!r}]",
+        )
+        res.raise_for_status()
+        logger.info(f"  {tag} ✅ Sent OK — status={res.status_code} | product={title!r}")
+        return True
+    except httpx.HTTPStatusError as e:
+        logger.error(
+            f"  {tag} ❌ WA Platform rejected product {title!r} — "
+            f"status={e.response.status_code} | body={e.response.text[:200]}"
+        )
+    except Exception as e:
+        logger.error(f"  {tag} ❌ Failed to send product {title!r} — error={e}")
+    return False
+
+
+async def _dispatch_products(api_key: str, phone_number: str, products: list):
     if not products or not api_key:
         logger.warning("send_product_messages — skipped: no products or api_key missing")
         return
 
-    to_send = products[:3]
+    to_send    = products[:3]
+    concurrent = settings.product_dispatch_concurrent
     logger.info("━" * 60)
-    logger.info(f"📤 PRODUCT DISPATCH — sending {len(to_send)} product(s) to {phone_number}")
+    logger.info(
+        f"📤 PRODUCT DISPATCH — sending {len(to_send)} product(s) to {phone_number} "
+        f"({'concurrent' if concurrent else 'sequential'})"
+    )
     logger.info("━" * 60)
 
     sent_ok = 0
+    bytes_saved = 0
     send_url = f"{settings.wa_platform_url.rstrip('/')}/api/send-message"
+    cards = [(f"[{idx}/{len(to_send)}]", p) for idx, p in enumerate(to_send, 1)]
+    for tag, p in cards:
+        logger.info(
+            f"  {tag} Processing: {p.get('title', 'Product')!r} | "
+            f"handle={p.get('handle', '')!r} | price={p.get('price', 'N/A')}"
+        )
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        for idx, p in enumerate(to_send, 1):
-            title     = p.get("title", "Product")
-            handle    = p.get("handle", "")
-            price     = p.get("price", "N/A")
-            image_url = p.get("image_url")
-
-            logger.info(f"  [{idx}/{len(to_send)}] Processing: {title!r} | handle={handle!r} | price={price}")
-
-            # ── 1. Guard: image_url required ────────────────────────────────
-            if not image_url:
-                logger.warning(f"  [{idx}/{len(to_send)}] ⚠️  Skipped — no image_url for product: {title!r}")
-                continue
-
-            # ── 2. Download image → retry up to 2x on transient network errors ──
-            try:
-                img_res = await retry_async(
-                    lambda: client.get(image_url),
-                    retries=2,
-                    delay=1.0,
-                    exceptions=(httpx.RequestError, httpx.TimeoutException),
-                    label=f"image-download [{title!r}]",
-                )
-                img_res.raise_for_status()
-                b64_data  = base64.b64encode(img_res.content).decode("utf-8")
-                # Detect MIME type from response headers (e.g. "image/jpeg", "image/png")
-                mime_type = img_res.headers.get("content-type", "image/jpeg").split(";")[0].strip()
-                ext       = mime_type.split("/")[-1]   # "jpeg", "png", "webp", etc.
-                filename  = f"{handle}.{ext}" if handle else f"product.{ext}"
-                logger.info(
-                    f"  [{idx}/{len(to_send)}] 🖼️  Image downloaded — "
-                    f"status={img_res.status_code} mime={mime_type} size={len(img_res.content):,} bytes"
-                )
-            except Exception as e:
-                logger.error(
-                    f"  [{idx}/{len(to_send)}] ❌ Image download FAILED for {title!r} "
-                    f"| url={image_url} | error={e}"
-                )
+    # Shared keep-alive pools: CDN downloads and WA Platform sends each reuse their connections
+    image_client = http_clients.get("product_images")
+    wa_client    = http_clients.get("wa_platform")
+    tasks: list[asyncio.Task] = []
+    if concurrent:
+        # All downloads start now; card N is sent once its image is in and
+        # cards 1..N-1 have gone out, so delivery order is unchanged.
+        tasks = [asyncio.create_task(_fetch_card_image(image_client, p, tag)) for tag, p in cards]
+        images = iter(tasks)
+    else:
+        # Lazily created — each download starts only after the previous card is sent
+        images = (_fetch_card_image(image_client, p, tag) for tag, p in cards)
+    try:
+        for (tag, p), pending in zip(cards, images):
+            image = await pending
+            if image is None:
                 continue
-
-            # ── 3. Build payload ─────────────────────────────────────────────
-            # Per API spec: `caption` inside the media object is what renders
-            # as text beneath the image in WhatsApp. Putting text in top-level
-            # `content` alongside a `media` object causes the image to be sent
-            # as a raw file/document instead of an inline picture.
-            url     = f"https://ismailsclothing.com/products/{handle}"
-            caption = f"*{title}*\n\n*PKR {price}*\n\n{url}"
-
-            payload = {
-                "phoneNumber": phone_number,
-                "content": caption,     # required non-empty field by the API
-                "media": {
-                    "type":     mime_type,  # e.g. "image/jpeg", "image/png"
-                    "data":     b64_data,
-                    "filename": filename,   # e.g. "bu25116-beg.jpeg"
-                    "caption":  caption,   # renders as text beneath the image in WhatsApp
-                }
-            }
-            headers = {
-                "x-api-key": api_key,
-                "Content-Type": "application/json",
-            }
-
-            # ── 4. POST to WA Platform → retry up to 3x on transient errors ──
-            # Only retry on network/timeout errors. 4xx responses (bad request,
-            # auth) are not retried since they won't change on a retry.
-            try:
-                res = await retry_async(
-                    lambda: client.post(send_url, json=payload, headers=headers),
-                    retries=3,
-                    delay=1.0,
-                    exceptions=(httpx.RequestError, httpx.TimeoutException),
-                    label=f"WA send-product [{title!r}]",
-                )
-                res.raise_for_status()
+            bytes_saved += image.bytes_saved
+            if await _send_card(wa_client, send_url, api_key, phone_number, p, image, tag):
                 sent_ok += 1
-                logger.info(
-                    f"  [{idx}/{len(to_send)}] ✅ Sent OK — "
-                    f"status={res.status_code} | product={title!r}"
-                )
-            except httpx.HTTPStatusError as e:
-                logger.error(
-                    f"  [{idx}/{len(to_send)}] ❌ WA Platform rejected product {title!r} — "
-                    f"status={e.response.status_code} | body={e.response.text[:200]}"
-                )
-            except Exception as e:
-                logger.error(
-                    f"  [{idx}/{len(to_send)}] ❌ Failed to send product {title!r} — error={e}"
-                )
+    finally:
+        for task in tasks:
+            task.cancel()
 
     logger.info("━" * 60)
     logger.info(
         f"📤 DISPATCH COMPLETE — {sent_ok}/{len(to_send)} product(s) sent successfully to {phone_number}"
+        + (f" | image bytes saved: {bytes_saved:,}" if bytes_saved else "")
     )
     logger.info("━" * 60)
+    if image_transformer.profile:
+        DISPATCH_IMAGE_BYTES_SAVED.observe(bytes_saved)
+
+
+async def _run_tracked(task_name: str, fn, *args):
+    """Run a background coroutine and keep the in-flight gauge accurate."""
+    try:
+        await fn(*args)
+    finally:
+        BACKGROUND_TASKS.dec(task_name)
+
+
+def _spawn_tracked(task_name: str, fn, *args) -> asyncio.Task:
+    BACKGROUND_TASKS.inc(task_name)
+    return asyncio.create_task(_run_tracked(task_name, fn, *args))
+
+
+def _add_tracked(background_tasks: BackgroundTasks, task_name: str, fn, *args) -> None:
+    BACKGROUND_TASKS.inc(task_name)
+    background_tasks.add_task(_run_tracked, task_name, fn, *args)
 
 
 async def send_text_message(api_key: str, phone_number: str, text: str):
@@ -162,18 +268,22 @@ async def send_text_message(api_key: str, phone_number: str, text: str):
     payload  = {"phoneNumber": phone_number, "content": text}
     headers  = {"x-api-key": api_key, "Content-Type": "application/json"}
 
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            res = await retry_async(
-                lambda: client.post(send_url, json=payload, headers=headers),
-                retries=3,
-                delay=1.0,
-                exceptions=(httpx.RequestError, httpx.TimeoutException),
-                label="WA send-text",
-            )
-            res.raise_for_status()
-        except Exception as e:
-            logger.error(f"send_text_message — all retries exhausted: {e}")
+    # Shorter read budget than card sends, on the same pooled connections
+    client  = http_clients.get("wa_platform")
+    timeout = httpx.Timeout(
+        settings.wa_platform_text_timeout_seconds, connect=settings.wa_platform_connect_timeout_seconds,
+    )
+    try:
+        res = await retry_async(
+            lambda: client.post(send_url, json=payload, headers=headers, timeout=timeout),
+            retries=3,
+            delay=1.0,
+            exceptions=(httpx.RequestError, httpx.TimeoutException),
+            label="WA send-text",
+        )
+        res.raise_for_status()
+    except Exception as e:
+        logger.error(f"send_text_message — all retries exhausted: {e}")
 
 
 # ─────────────────────────────────────────────────────────────
@@ -185,7 +295,7 @@ async def send_text_message(api_key: str, phone_number: str, text: str):
 @router.post("/provision")
 async def provision_store(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Called by the Shopify embedded frontend when the merchant clicks
@@ -200,8 +310,10 @@ async def provision_store(
     if not shop_domain:
         raise HTTPException(status_code=400, detail="Missing 'shop' field")
 
-    repo = ShopInstallationRepository(db)
-    install = repo.get_offline_by_shop(shop_domain)
+    repo = AsyncShopInstallationRepository(db)
+    # Uncached — this acts on the result; a stale miss would 404 a shop that just
+    # finished OAuth on another worker, a stale wa_agent_id would provision twice
+    install = await repo.get_offline_by_shop(shop_domain, use_cache=False)
 
     if not install:
         raise HTTPException(
@@ -234,15 +346,14 @@ async def provision_store(
     logger.info("provision — calling WA Platform for shop=%s url=%s", shop_domain, provision_url)
 
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                provision_url,
-                json=payload,
-                headers={
-                    "Content-Type": "application/json",
-                    "x-shopify-secret": settings.wa_platform_shared_secret,
-                },
-            )
+        response = await http_clients.get("wa_platform").post(
+            provision_url,
+            json=payload,
+            headers={
+                "Content-Type": "application/json",
+                "x-shopify-secret": settings.wa_platform_shared_secret,
+            },
+        )
         response.raise_for_status()
         data = response.json()
     except httpx.HTTPStatusError as e:
@@ -264,12 +375,14 @@ async def provision_store(
         logger.error("provision — WA Platform response missing agentId/apiKey: %s", data)
         raise HTTPException(status_code=502, detail="Invalid response from WhatsApp Platform")
 
-    repo.update_wa_provisioning(
+    install = await repo.update_wa_provisioning(
         shop_domain=shop_domain,
         wa_agent_id=agent_id,
         wa_api_key=api_key,
         wa_status=status,
     )
+    if install:
+        agent_event_broker.publish(shop_domain, _agent_state(install))
 
     logger.info("provision — ✅ success for shop=%s agent=%s status=%s", shop_domain, agent_id, status)
     return {
@@ -281,29 +394,125 @@ async def provision_store(
     }
 
 
+def _agent_state(install: ShopInstallation) -> dict:
+    """Agent state as returned by /agent-status and pushed on /agent-events."""
+    qr_hash = install.wa_qr_hash
+    return {
+        "wa_agent_id":    install.wa_agent_id,
+        "wa_status":      install.wa_status or "NOT_PROVISIONED",
+        "wa_phone_number": install.wa_phone_number,
+        "wa_qr_hash":     qr_hash,
+        "wa_qr_url":      f"{router.prefix}/qr-image/{qr_hash}" if qr_hash else None,   # render as <img>
+    }
+
+
+def _status_use_cache() -> bool:
+    """
+    Display reads go through installation_cache: local writes invalidate it and other
+    workers' writes show up within the TTL. Opt out with several workers.
+    """
+    return not (settings.agent_status_uncached_multi_worker and settings.web_concurrency > 1)
+
+
+def _if_none_match(request: Request) -> set[str]:
+    header = request.headers.get("if-none-match", "")
+    return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+
 # ─────────────────────────────────────────────────────────────
 # Endpoint: GET /api/whatsapp/agent-status?shop=...
 # Used by the frontend to poll current WA connection state + QR.
 # ─────────────────────────────────────────────────────────────
 
 @router.get("/agent-status")
-def get_agent_status(shop: str, db: Session = Depends(get_db)):
+def get_agent_status(shop: str, request: Request, db: Session = Depends(get_db)):
     """
     Returns the current WhatsApp agent state for a shop.
     The frontend polls this to know when to show the QR code or connected state.
+    The QR itself is served by /qr-image/{hash}; the response carries an ETag,
+    so unchanged polls are answered with 304.
     """
     repo = ShopInstallationRepository(db)
-    install = repo.get_offline_by_shop(shop)
+    install = repo.get_offline_by_shop(shop, use_cache=_status_use_cache())
 
     if not install:
         raise HTTPException(status_code=404, detail="Shop not found")
 
-    return {
-        "wa_agent_id":    install.wa_agent_id,
-        "wa_status":      install.wa_status or "NOT_PROVISIONED",
-        "wa_phone_number": install.wa_phone_number,
-        "wa_qr_code":     install.wa_qr_code,   # data URI — render as <img>
-    }
+    content = json.dumps(_agent_state(install), separators=(",", ":")).encode("utf-8")
+    etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in _if_none_match(request):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+# ─────────────────────────────────────────────────────────────
+# Endpoint: GET /api/whatsapp/agent-events?shop=...
+# Server-sent events: pushes the agent state whenever /qr or /status
+# changes it, so the frontend doesn't have to poll.
+# ─────────────────────────────────────────────────────────────
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+@router.get("/agent-events")
+async def stream_agent_events(shop: str, request: Request):
+    """
+    Stream `agent-status` events for a shop. The current state is sent first,
+    then every change the webhooks persist; idle streams get a heartbeat comment.
+    """
+    # Own short-lived session — a request-scoped one would stay open for the whole stream
+    async with AsyncSessionLocal() as db:
+        install = await AsyncShopInstallationRepository(db).get_offline_by_shop(shop, use_cache=_status_use_cache())
+    if not install:
+        raise HTTPException(status_code=404, detail="Shop not found")
+    initial = _agent_state(install)
+    # Subscribe before responding so nothing published in between is missed
+    queue = agent_event_broker.subscribe(shop)
+
+    async def event_stream():
+        try:
+            yield f"retry: 3000\n{_sse('agent-status', initial)}"
+            while not agent_event_broker.shutting_down and not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=settings.agent_events_heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event is None:   # broker closed (shutdown)
+                    break
+                yield _sse("agent-status", event)
+        finally:
+            agent_event_broker.unsubscribe(shop, queue)
+
+    logger.info("agent-events — stream opened for shop=%s", shop)
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: stop nginx from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ─────────────────────────────────────────────────────────────
+# Endpoint: GET /api/whatsapp/qr-image/{content_hash}
+# QR images are content-addressed, so a URL never changes meaning.
+# ─────────────────────────────────────────────────────────────
+
+@router.get("/qr-image/{content_hash}")
+async def get_qr_image(content_hash: str, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Serve a stored WhatsApp QR code as an image, with ETag / If-None-Match support."""
+    etag = f'"{content_hash}"'
+    # Private: a linking QR must not end up in shared caches
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if etag in _if_none_match(request):
+        return Response(status_code=304, headers=headers)
+
+    image = await AsyncWaQrImageRepository(db).get_by_hash(content_hash)
+    if image is None:
+        raise HTTPException(status_code=404, detail="QR code not found")
+    return Response(content=image.data, media_type=image.mime_type, headers=headers)
 
 
 # ─────────────────────────────────────────────────────────────
@@ -316,7 +525,6 @@ async def receive_message(
     request: Request,
     background_tasks: BackgroundTasks,
     x_wa_signature: str = Header(default=None),
-    db: Session = Depends(get_db),
 ):
     """
     Called by the WhatsApp Platform when a customer sends a message.
@@ -324,17 +532,29 @@ async def receive_message(
     Return { "content": "" } to send no reply.
     """
     raw_body = await request.body()
+    trace = start_trace("whatsapp_message")
 
     # ── Signature verification ──────────────────────────────
-    if settings.wa_platform_shared_secret:
-        if not x_wa_signature:
-            logger.warning("/messages — missing x-wa-signature header")
-            raise HTTPException(status_code=401, detail="Missing signature")
-        if not verify_wa_signature(raw_body, x_wa_signature, settings.wa_platform_shared_secret):
-            logger.warning("/messages — invalid x-wa-signature")
-            raise HTTPException(status_code=401, detail="Invalid signature")
-
-    payload = json.loads(raw_body)
+    with trace.span("signature_verification"):
+        if settings.wa_platform_shared_secret:
+            if not x_wa_signature:
+                logger.warning("/messages — missing x-wa-signature header")
+                trace.finish(outcome="rejected")
+                raise HTTPException(status_code=401, detail="Missing signature")
+            if not verify_wa_signature(raw_body, x_wa_signature, settings.wa_platform_shared_secret):
+                logger.warning("/messages — invalid x-wa-signature")
+                trace.finish(outcome="rejected")
+                raise HTTPException(status_code=401, detail="Invalid signature")
+
+    with trace.span("payload_parse"):
+        try:
+            payload = json.loads(raw_body)
+        except ValueError:   # JSONDecodeError, or a body that isn't UTF-8
+            payload = None
+    if not isinstance(payload, dict):
+        logger.warning("/messages — body is not a JSON object (length=%d)", len(raw_body))
+        trace.finish(outcome="rejected")
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
 
     # ── Extract fields ──────────────────────────────────────
     metadata    = payload.get("metadata", {})
@@ -371,6 +591,7 @@ async def receive_message(
 
     media_url    = media.get("url") if media else None  # Only used for SigLIP visual embedding
     chat_history = payload.get("chatHistory", [])
+    trace.fields.update(shop=domain, message_id=message_id)
 
     logger.info(
         "/messages — shop=%s | from=%s (%s) | msg_id=%s | content=%r | has_processed=%s | has_media=%s | history_len=%d",
@@ -383,17 +604,25 @@ async def receive_message(
     #   1. on_search_start  → asyncio.create_task()      fires immediately (before response)
     #   2. return reply     → {"content": reply}          inline text reply to WA platform
     #   3. on_products_found → background_tasks.add_task  fires after response is sent
+    dispatch_scheduled = False
     try:
         async def _on_search_start(msg: str):
             # Fire immediately so the customer sees "Searching..." right away
             if wa_api_key and from_number:
-                asyncio.create_task(send_text_message(wa_api_key, from_number, msg))
+                _spawn_tracked("searching_message", send_text_message, wa_api_key, from_number, msg)
 
         async def _on_products_found(products: list):
             # Schedule after the inline reply is returned so product cards
             # always arrive after the text response, never before it
-            if products and wa_api_key and from_number:
-                background_tasks.add_task(send_product_messages, wa_api_key, from_number, products)
+            nonlocal dispatch_scheduled
+            if products and wa_api_key and from_number and not dispatch_scheduled:
+                # The dispatch task finishes the trace once the cards are sent
+                dispatch_scheduled = True
+                _add_tracked(background_tasks, "product_dispatch", send_product_messages,
+                             wa_api_key, from_number, products, trace)
+            elif products and wa_api_key and from_number:
+                _add_tracked(background_tasks, "product_dispatch", send_product_messages,
+                             wa_api_key, from_number, products)
 
         reply = await ai_service.process_whatsapp_message(
             text_content=effective_text,
@@ -408,6 +637,9 @@ async def receive_message(
         logger.error(f"Error calling AI service: {e}")
         reply = "I'm sorry, I'm experiencing technical difficulties right now. Please try again later."
 
+    if not dispatch_scheduled:
+        trace.finish()
+
     # Return the AI reply inline — WA platform displays this as the chat response
     return {"content": reply}
 
@@ -421,7 +653,7 @@ async def receive_message(
 async def receive_qr(
     request: Request,
     x_wa_signature: str = Header(default=None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Called by the WA Platform when a new QR code is generated.
@@ -445,10 +677,12 @@ async def receive_qr(
     logger.info("/qr — shop=%s | qr_length=%d", domain, len(qr_code) if qr_code else 0)
 
     if domain and qr_code:
-        ShopInstallationRepository(db).update_wa_qr_code(
+        install = await AsyncShopInstallationRepository(db).update_wa_qr_code(
             shop_domain=domain,
             wa_qr_code=qr_code,
         )
+        if install:
+            agent_event_broker.publish(domain, _agent_state(install))
 
     return {"received": True}
 
@@ -462,7 +696,7 @@ async def receive_qr(
 async def receive_status(
     request: Request,
     x_wa_signature: str = Header(default=None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     Called by the WA Platform when the WhatsApp connection state changes.
@@ -501,12 +735,14 @@ async def receive_status(
 
     wa_status = STATUS_MAP.get(event)
     if wa_status and domain:
-        ShopInstallationRepository(db).update_wa_status(
+        install = await AsyncShopInstallationRepository(db).update_wa_status(
             shop_domain=domain,
             wa_status=wa_status,
             wa_phone_number=phone_number,
         )
         logger.info("/status — DB updated: shop=%s status=%s", domain, wa_status)
+        if install:
+            agent_event_broker.publish(domain, _agent_state(install))
     else:
         logger.warning("/status — unknown event=%s for shop=%s", event, domain)
 
@@ -0,0 +1,107 @@
+"""
+Agent Events
+────────────
+In-process pub/sub for WhatsApp agent state, keyed by shop domain.
+
+The /qr and /status webhooks (and provisioning) publish the shop's new agent
+state right after persisting it; every open /agent-events stream for that shop
+receives it through its own bounded queue. A slow subscriber never blocks the webhook —
+when its queue is full the oldest event is dropped, since only the latest
+state matters to the UI.
+
+Subscribers live in this process only: with several workers, a webhook handled
+by one worker doesn't reach streams held by another. The page therefore keeps a
+slow agent-status poll (agent_events_live_poll_seconds) running while its
+stream is live, so such changes show up within one poll interval.
+
+On app shutdown the broker's shutdown event is set and every open stream ends.
+uvicorn only runs lifespan shutdown once connections have drained, so run it with
+--timeout-graceful-shutdown to bound how long open streams can hold the process.
+"""
+import asyncio
+from typing import Dict, Optional, Set
+
+from app.config.settings import settings
+from app.utils.logger import get_logger
+from app.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+EVENTS_DROPPED = metrics.counter(
+    "agent_events_dropped_total", "Agent events dropped because a subscriber queue was full.",
+)
+
+# Pushed to every queue on shutdown so open streams end
+CLOSED = None
+
+
+class AgentEventBroker:
+    """Fan-out of per-shop agent events to bounded subscriber queues."""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._shutdown = asyncio.Event()
+
+    @property
+    def shutting_down(self) -> bool:
+        """True once close() ran — streams check it and end."""
+        return self._shutdown.is_set()
+
+    def start(self) -> None:
+        """Accept streams again (app startup; a previous shutdown may have closed the broker)."""
+        self._shutdown.clear()
+
+    def subscribe(self, shop_domain: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.agent_events_queue_size)
+        self._subscribers.setdefault(shop_domain, set()).add(queue)
+        logger.debug(f"Agent events: +1 subscriber for {shop_domain} ({len(self._subscribers[shop_domain])} open)")
+        return queue
+
+    def unsubscribe(self, shop_domain: str, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(shop_domain)
+        if not queues:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[shop_domain]
+
+    def publish(self, shop_domain: str, event: dict) -> int:
+        """Queue an event for every subscriber of the shop; returns how many got it."""
+        queues = self._subscribers.get(shop_domain, ())
+        for queue in queues:
+            self._offer(queue, event)
+        if queues:
+            logger.debug(f"Agent events: published to {len(queues)} subscriber(s) for {shop_domain}")
+        return len(queues)
+
+    def close(self) -> None:
+        """Set the shutdown event and end every open stream (app shutdown)."""
+        self._shutdown.set()
+        for queues in self._subscribers.values():
+            for queue in queues:
+                self._offer(queue, CLOSED)
+        self._subscribers.clear()
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, event: Optional[dict]) -> None:
+        if queue.full():
+            queue.get_nowait()
+            EVENTS_DROPPED.inc()
+        queue.put_nowait(event)
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+
+# Singleton instance
+agent_event_broker = AgentEventBroker()
+
+
+def _subscriber_counts():
+    yield (), agent_event_broker.subscriber_count()
+
+
+metrics.callback(
+    "agent_events_subscribers", "Open agent-event streams.",
+    [], _subscriber_counts,
+)
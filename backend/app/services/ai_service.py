@@ -1,17 +1,19 @@
 import asyncio
 import json
-from typing import List, Dict, Any, Optional
+import time
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
 
 import openai
 from openai import AsyncOpenAI
 from app.config.settings import settings
 from app.utils.logger import get_logger
+from app.utils.metrics import OPENAI_LATENCY, SEARCH_EXCLUSION_FILTER_CHARS, record_openai_usage
 from app.utils.retry import retry_async
+from app.utils.timing import record_span, span
 from app.services.embedding_service import embedding_service
 from app.services.search_service import search_service
 from app.prompts.whatsapp_prompts import SYSTEM_PROMPT, SEARCH_TOOL_SCHEMA
-from app.database.engine import SessionLocal
-from app.database.repositories.product_session_repository import ProductSessionRepository
+from app.services.product_session_service import ProductSessionTurn, product_session_service
 
 logger = get_logger(__name__)
 
@@ -36,14 +38,17 @@ class AIService:
             {"role": "system", "content": SYSTEM_PROMPT}
         ]
 
-        # ── Inject previously shown products into system prompt ───────────────────
+        # ── Load the product session once for the whole turn ──────────────────
+        session: Optional[ProductSessionTurn] = None
         if phone_number:
-            with SessionLocal() as db:
-                repo = ProductSessionRepository(db)
-                prev = repo.get_products(phone_number)
+            with span("session_read"):
+                session = await product_session_service.begin_turn(phone_number)
+
+        # ── Inject previously shown products into system prompt ───────────────────
+        if session:
+            recent = session.recent_products
 
-            # Take the N most recent entries and format like format_products_for_ai
-            recent = prev[-settings.session_context_limit:] if prev else []
+            # Format like format_products_for_ai
             if recent:
                 prev_lines = [
                     "\n\n[Products previously shown to this customer "
@@ -100,19 +105,23 @@ class AIService:
             # RateLimitError gets a longer initial delay (5s) since the quota
             # needs time to replenish. Auth/invalid-request errors are permanent
             # and are NOT retried.
-            response = await retry_async(
-                lambda: self.client.chat.completions.create(
-                    model=settings.chat_model,
-                    messages=messages,
-                    tools=[SEARCH_TOOL_SCHEMA],
-                    tool_choice="auto",
-                    max_tokens=500,
-                ),
-                retries=3,
-                delay=2.0,
-                exceptions=(openai.APIConnectionError, openai.APITimeoutError),
-                label="openai-first-call",
-            )
+            with span("llm_first_call"):
+                started = time.perf_counter()
+                response = await retry_async(
+                    lambda: self.client.chat.completions.create(
+                        model=settings.chat_model,
+                        messages=messages,
+                        tools=[SEARCH_TOOL_SCHEMA],
+                        tool_choice="auto",
+                        max_tokens=500,
+                    ),
+                    retries=3,
+                    delay=2.0,
+                    exceptions=(openai.APIConnectionError, openai.APITimeoutError),
+                    label="openai-first-call",
+                )
+                OPENAI_LATENCY.observe(time.perf_counter() - started, "chat")
+                record_openai_usage("chat", response.usage)
 
 
             response_message = response.choices[0].message
@@ -146,10 +155,8 @@ class AIService:
 
                         # ── Load shown handles for exclusion ───────────────────────
                         shown_handles: list[str] = []
-                        if phone_number:
-                            with SessionLocal() as db:
-                                repo = ProductSessionRepository(db)
-                                shown_handles = repo.get_shown_handles(phone_number)
+                        if session:
+                            shown_handles = session.shown_handles
                             logger.info(f"� Session: {len(shown_handles)} handles to exclude")
 
                         # Execute the search — returns (full_results, ai_context, search_context)
@@ -160,23 +167,20 @@ class AIService:
                             exclude_handles=shown_handles,
                         )
 
-                        # ── Save new products to session (with description) ─────────
-                        if phone_number and full_results:
-                            with SessionLocal() as db:
-                                repo = ProductSessionRepository(db)
-                                repo.append_products(phone_number, [
-                                    {
-                                        "title":       r.get("title"),
-                                        "color":       r.get("color"),
-                                        "size":        r.get("size"),
-                                        "price":       r.get("price"),
-                                        "handle":      r.get("handle"),
-                                        "type":        r.get("type"),
-                                        "description": r.get("description", ""),
-                                    }
-                                    for r in full_results
-                                ])
-                            logger.info(f"💾 Saved {len(full_results)} products to session for {phone_number}")
+                        # ── Buffer new products for the session (with description) ───
+                        if session and full_results:
+                            session.add_products([
+                                {
+                                    "title":       r.get("title"),
+                                    "color":       r.get("color"),
+                                    "size":        r.get("size"),
+                                    "price":       r.get("price"),
+                                    "handle":      r.get("handle"),
+                                    "type":        r.get("type"),
+                                    "description": r.get("description", ""),
+                                }
+                                for r in full_results
+                            ])
 
                         # Dispatch image cards to WhatsApp using full results (has image_url + handle)
                         if on_products_found:
@@ -191,17 +195,21 @@ class AIService:
 
                 # Second call to OpenAI — retry the same way
                 logger.info("Sending tool results back to OpenAI")
-                final_response = await retry_async(
-                    lambda: self.client.chat.completions.create(
-                        model=settings.chat_model,
-                        messages=messages,
-                        max_tokens=500,
-                    ),
-                    retries=3,
-                    delay=2.0,
-                    exceptions=(openai.APIConnectionError, openai.APITimeoutError),
-                    label="openai-second-call",
-                )
+                with span("llm_second_call"):
+                    started = time.perf_counter()
+                    final_response = await retry_async(
+                        lambda: self.client.chat.completions.create(
+                            model=settings.chat_model,
+                            messages=messages,
+                            max_tokens=500,
+                        ),
+                        retries=3,
+                        delay=2.0,
+                        exceptions=(openai.APIConnectionError, openai.APITimeoutError),
+                        label="openai-second-call",
+                    )
+                    OPENAI_LATENCY.observe(time.perf_counter() - started, "chat")
+                    record_openai_usage("chat", final_response.usage)
                 
                 return final_response.choices[0].message.content
 
@@ -213,6 +221,16 @@ class AIService:
             logger.error(f"Error processing message with AI: {e}")
             return "I'm sorry, I'm having trouble connecting to my system right now. Please try again later."
 
+        finally:
+            # ── Save everything shown this turn in one write ──────────────────
+            if session and session.dirty:
+                try:
+                    with span("session_write"):
+                        saved = await session.flush()
+                    logger.info(f"💾 Saved {saved} products to session for {phone_number}")
+                except Exception as e:
+                    logger.error(f"Failed to save product session for {phone_number}: {e}")
+
     async def _execute_search(
         self,
         text_query: str,
@@ -234,17 +252,14 @@ class AIService:
         if max_price is not None:
             filters.append(f"price <= {max_price}")
 
-        # Build handle exclusion filter
-        exclusion_filter = None
+        # Build handle exclusion (bounded filter clause + local post-filter)
+        exclusion = _plan_exclusion(exclude_handles or [])
         if exclude_handles:
-            quoted = ", ".join(f'"{h}"' for h in exclude_handles)
-            exclusion_filter = f"handle NOT IN [{quoted}]"
-            logger.info(f"   exclude      : {len(exclude_handles)} handles")
-
-        def _with_exclusion(f_str: Optional[str]) -> Optional[str]:
-            """AND the exclusion clause onto whatever filter string is passed in."""
-            parts = [p for p in [f_str, exclusion_filter] if p]
-            return " AND ".join(parts) if parts else None
+            logger.info(
+                f"   exclude      : {len(exclude_handles)} handles "
+                f"({exclusion.filtered} in filter, {len(exclusion.local)} post-filtered, "
+                f"filter={len(exclusion.filter or '')} chars)"
+            )
 
         filter_str = " AND ".join(filters) if filters else None
 
@@ -259,7 +274,8 @@ class AIService:
 
         # ── Embed the text query with OpenAI ───────────────────────────────────
         try:
-            text_vector = await asyncio.to_thread(embedding_service.embed_text, text_query) if text_query else None
+            with span("embedding"):
+                text_vector = await embedding_service.embed_text_async(text_query) if text_query else None
         except Exception as e:
             logger.error(f"OpenAI text embedding failed: {e}")
             text_vector = None
@@ -272,74 +288,15 @@ class AIService:
         logger.info(f"   limit        : {settings.search_top_k}")
         logger.info("━" * 60)
 
-        # ── Helper: standard search (with optional score threshold) ───────────
-        def _search(f_str, min_score: float = None):
-            return search_service.perform_hybrid_search(
-                query=text_query,
-                text_vector=text_vector,
-                limit=settings.search_top_k,
-                filter_str=f_str,
-                ranking_score_threshold=min_score,
-            )
-
         # ── Progressive filter cascade ─────────────────────────────────────────
-        search_context = ""   # will describe what filters were actually used
-
         # Build a human-readable description of what was requested
         requested_parts = []
         if color:     requested_parts.append(f"color={color.upper()}")
         if max_price: requested_parts.append(f"max_price={max_price}")
         requested_desc = ", ".join(requested_parts) if requested_parts else "none"
 
-        # ── Stage 1: Full filter (color + price) ──────────────────────────────
-        results = await asyncio.to_thread(_search, filter_str)
-        logger.info(f"🔎 Stage 1 (full filter: {filter_str!r}): {len(results)} hits")
-
-        if results:
-            search_context = (
-                f"Filters requested: {requested_desc}. "
-                f"All filters applied — results are exact matches."
-            )
-
-        # ── Stage 2: Color only (drop price) ──────────────────────────────────
-        if not results and color:
-            color_filter_str = f'color = "{color.upper()}"'
-            logger.info(f"⚡ Stage 2 (color only: {color_filter_str!r})…")
-            results = await asyncio.to_thread(_search, color_filter_str)
-            logger.info(f"   color-only: {len(results)} hits")
-            if results:
-                search_context = (
-                    f"Filters requested: {requested_desc}. "
-                    f"No products matched both color and price together. "
-                    f"Showing products that match the color ({color.upper()}) — price filter was relaxed. "
-                    f"These may exceed the requested budget."
-                )
-
-        # ── Stage 3: Price only (drop color) ──────────────────────────────────
-        if not results and max_price is not None:
-            price_filter_str = f"price <= {max_price}"
-            logger.info(f"⚡ Stage 3 (price only: {price_filter_str!r})…")
-            results = await asyncio.to_thread(_search, price_filter_str)
-            logger.info(f"   price-only: {len(results)} hits")
-            if results:
-                search_context = (
-                    f"Filters requested: {requested_desc}. "
-                    f"No products matched the requested color ({color.upper() if color else 'N/A'}). "
-                    f"Showing products within the budget (≤ {max_price}) — color filter was relaxed. "
-                    f"These are not the requested color."
-                )
-
-        # ── Stage 4: No filter — pure semantic search with score threshold ────
-        if not results:
-            logger.info(f"⚡ Stage 4: Unfiltered semantic search (min_score={settings.search_min_score})…")
-            results = await asyncio.to_thread(_search, None, settings.search_min_score)
-            logger.info(f"   unfiltered: {len(results)} hits (score ≥ {settings.search_min_score})")
-            search_context = (
-                f"Filters requested: {requested_desc}. "
-                f"No products matched any of the requested filters. "
-                f"Showing best semantic matches from the full catalog — NOT filtered results. "
-                f"Inform the customer that exact matches were not found and offer alternatives."
-            )
+        stages = _build_cascade_stages(color, max_price, filter_str, requested_desc)
+        results, search_context = await self._run_cascade(stages, text_query, text_vector, exclusion)
         # ──────────────────────────────────────────────────────────────────────
 
         # Cap to top_k (safety net — Stage 2 can still return extras in edge cases)
@@ -373,6 +330,237 @@ class AIService:
 
         return full_results, ai_context, search_context
 
+    # ── Cascade execution strategies ───────────────────────────────────────────
+
+    async def _run_cascade(
+        self,
+        stages: List["CascadeStage"],
+        text_query: str,
+        text_vector: Optional[List[float]],
+        exclusion: Optional["HandleExclusion"] = None,
+    ) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        Resolve the relaxation stages using settings.search_cascade_mode and
+        return (hits of the highest-priority stage with results, its search_context).
+        Already-shown handles are excluded from every stage (see _plan_exclusion).
+        Per-stage wall time is logged so the modes can be compared on tail latency.
+        """
+        mode = settings.search_cascade_mode
+        exclusion = exclusion or _plan_exclusion([])
+        timings: Dict[str, Optional[float]] = {}
+        started = time.perf_counter()
+
+        async def _search(stage: CascadeStage) -> List[Dict[str, Any]]:
+            t0 = time.perf_counter()
+            try:
+                hits = await search_service.perform_hybrid_search_async(
+                    query=text_query,
+                    text_vector=text_vector,
+                    limit=settings.search_top_k + exclusion.overfetch,
+                    filter_str=exclusion.apply(stage.filter),
+                    ranking_score_threshold=stage.min_score,
+                    log_results=False,
+                )
+                return exclusion.post_filter(hits)
+            finally:
+                timings[stage.key] = round((time.perf_counter() - t0) * 1000, 2)
+
+        if mode == "parallel":
+            winner, results = await self._cascade_parallel(stages, _search, timings)
+        elif mode == "multi":
+            winner, results = await self._cascade_multi(
+                stages, _search, text_query, text_vector, timings, exclusion
+            )
+        else:
+            winner, results = await self._cascade_sequential(stages, _search)
+
+        total_ms = round((time.perf_counter() - started) * 1000, 2)
+        for key, ms in timings.items():
+            if ms is not None:
+                record_span(f"search.{key}", ms)
+        record_span(f"search.cascade.{mode}", total_ms)
+        stage_desc = ", ".join(
+            f"{k}={timings[k]}ms" if timings[k] is not None else f"{k}=cancelled"
+            for k in ["multi"] + [st.key for st in stages]
+            if k in timings
+        )
+        logger.info(f"⏱  Cascade [{mode}] winner={winner.key} total={total_ms}ms | {stage_desc}")
+
+        search_service.log_hits(results)
+        return results, winner.context
+
+    async def _cascade_sequential(self, stages, search) -> Tuple["CascadeStage", List[Dict[str, Any]]]:
+        """One stage at a time — stop at the first stage that returns hits."""
+        results: List[Dict[str, Any]] = []
+        for stage in stages:
+            results = await search(stage)
+            logger.info(f"🔎 {stage.name} (filter: {stage.filter!r}): {len(results)} hits")
+            if results:
+                return stage, results
+        return stages[-1], results
+
+    async def _cascade_parallel(self, stages, search, timings) -> Tuple["CascadeStage", List[Dict[str, Any]]]:
+        """
+        Speculative: launch every stage at once, then take them in priority order.
+        As soon as a stage has hits, the lower-priority stages still in flight are cancelled.
+        """
+        tasks = [asyncio.create_task(search(stage)) for stage in stages]
+        try:
+            results: List[Dict[str, Any]] = []
+            for stage, task in zip(stages, tasks):
+                results = await task
+                logger.info(f"🔎 {stage.name} (filter: {stage.filter!r}): {len(results)} hits")
+                if results:
+                    return stage, results
+            return stages[-1], results
+        finally:
+            for stage, task in zip(stages, tasks):
+                if not task.done():
+                    timings[stage.key] = None
+                    task.cancel()
+
+    async def _cascade_multi(
+        self, stages, search, text_query, text_vector, timings, exclusion
+    ) -> Tuple["CascadeStage", List[Dict[str, Any]]]:
+        """
+        All stages in one /multi-search round-trip, resolved locally in priority
+        order. Falls back to the sequential cascade if the request itself fails.
+        """
+        t0 = time.perf_counter()
+        try:
+            stage_hits = await search_service.perform_hybrid_multi_search_async(
+                query=text_query,
+                text_vector=text_vector,
+                limit=settings.search_top_k + exclusion.overfetch,
+                stages=[(exclusion.apply(st.filter), st.min_score) for st in stages],
+            )
+        except Exception as e:
+            logger.warning(f"Multi-search failed ({e}) — running cascade stage by stage")
+            return await self._cascade_sequential(stages, search)
+        finally:
+            timings["multi"] = round((time.perf_counter() - t0) * 1000, 2)
+
+        results: List[Dict[str, Any]] = []
+        for stage, hits in zip(stages, stage_hits):
+            results = exclusion.post_filter(hits)
+            logger.info(f"🔎 {stage.name} (filter: {stage.filter!r}): {len(results)} hits")
+            if results:
+                return stage, results
+        return stages[-1], results
+
+
+class HandleExclusion(NamedTuple):
+    filter: Optional[str]    # `handle NOT IN [...]` clause ANDed onto every stage, or None
+    local: frozenset         # handles too old for the filter — dropped from the hits locally
+    overfetch: int           # extra hits requested per stage to make up for local drops
+    filtered: int            # number of handles in the filter clause
+
+    def apply(self, f_str: Optional[str]) -> Optional[str]:
+        """AND the exclusion clause onto whatever filter string is passed in."""
+        parts = [p for p in [f_str, self.filter] if p]
+        return " AND ".join(parts) if parts else None
+
+    def post_filter(self, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self.local:
+            hits = [h for h in hits if h.get("handle") not in self.local]
+        return hits[:settings.search_top_k]
+
+
+def _plan_exclusion(handles: List[str]) -> HandleExclusion:
+    """
+    Bound the exclusion filter, choosing the strategy from the list size:
+      - up to search_exclusion_max_filter_handles → all handles in `handle NOT IN [...]`
+      - more than that → the most recent ones in the filter (they are the likeliest
+        to match again), the older ones dropped locally from over-fetched hits
+    `handles` is oldest first, as stored in the product session.
+    """
+    cap = max(0, settings.search_exclusion_max_filter_handles)
+    in_filter = handles[-cap:] if cap else []
+    local = frozenset(handles[:-cap] if cap else handles)
+
+    exclusion_filter = None
+    if in_filter:
+        quoted = ", ".join('"' + h.replace('"', '\\"') + '"' for h in in_filter)
+        exclusion_filter = f"handle NOT IN [{quoted}]"
+
+    if handles:
+        strategy = "post_filter" if local else "filter"
+        SEARCH_EXCLUSION_FILTER_CHARS.observe(len(exclusion_filter or ""), strategy)
+
+    return HandleExclusion(
+        filter=exclusion_filter,
+        local=local,
+        overfetch=min(len(local), max(0, settings.search_exclusion_overfetch)),
+        filtered=len(in_filter),
+    )
+
+
+class CascadeStage(NamedTuple):
+    key: str                 # short id used for timings ("full", "color", "price", "unfiltered")
+    name: str
+    filter: Optional[str]
+    min_score: Optional[float]
+    context: str             # search_context handed to the LLM if this stage wins
+
+
+def _build_cascade_stages(
+    color: Optional[str],
+    max_price: Optional[float],
+    filter_str: Optional[str],
+    requested_desc: str,
+) -> List[CascadeStage]:
+    """
+    Relaxation stages in priority order:
+      1. full filter (color + price)
+      2. color only   — only if a color was requested
+      3. price only   — only if a max price was requested
+      4. no filter    — pure semantic search with score threshold
+    """
+    stages = [CascadeStage(
+        "full",
+        "Stage 1 (full filter)",
+        filter_str,
+        None,
+        f"Filters requested: {requested_desc}. "
+        f"All filters applied — results are exact matches.",
+    )]
+
+    if color:
+        stages.append(CascadeStage(
+            "color",
+            "Stage 2 (color only)",
+            f'color = "{color.upper()}"',
+            None,
+            f"Filters requested: {requested_desc}. "
+            f"No products matched both color and price together. "
+            f"Showing products that match the color ({color.upper()}) — price filter was relaxed. "
+            f"These may exceed the requested budget.",
+        ))
+
+    if max_price is not None:
+        stages.append(CascadeStage(
+            "price",
+            "Stage 3 (price only)",
+            f"price <= {max_price}",
+            None,
+            f"Filters requested: {requested_desc}. "
+            f"No products matched the requested color ({color.upper() if color else 'N/A'}). "
+            f"Showing products within the budget (≤ {max_price}) — color filter was relaxed. "
+            f"These are not the requested color.",
+        ))
+
+    stages.append(CascadeStage(
+        "unfiltered",
+        f"Stage 4 (unfiltered, min_score={settings.search_min_score})",
+        None,
+        settings.search_min_score,
+        f"Filters requested: {requested_desc}. "
+        f"No products matched any of the requested filters. "
+        f"Showing best semantic matches from the full catalog — NOT filtered results. "
+        f"Inform the customer that exact matches were not found and offer alternatives.",
+    ))
+    return stages
+
 
 def format_products_for_ai(
     products: list,
@@ -0,0 +1,104 @@
+"""
+Async Meilisearch Client
+────────────────────────
+Minimal httpx-based client for the Meilisearch REST search endpoints.
+
+The official `meilisearch` package is synchronous, so every query used to
+cost a worker thread via asyncio.to_thread. This client keeps one pooled,
+keep-alive httpx.AsyncClient per event loop and is only used for read
+queries — index management still goes through SearchService's sync client.
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+
+import httpx
+
+from app.config.settings import settings
+from app.utils.logger import get_logger
+from app.utils.metrics import MEILISEARCH_LATENCY
+
+logger = get_logger(__name__)
+
+
+class AsyncMeilisearchClient:
+    def __init__(self, url: str, api_key: str):
+        self.url = url.rstrip("/")
+        self.api_key = api_key
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            if self._client is not None:
+                self._release_client()
+            headers = {"Content-Type": "application/json"}
+            if self.api_key:
+                headers["Authorization"] = f"Bearer {self.api_key}"
+            self._client = httpx.AsyncClient(
+                base_url=self.url,
+                headers=headers,
+                timeout=settings.meilisearch_timeout_seconds,
+                limits=httpx.Limits(
+                    max_connections=settings.meilisearch_max_connections,
+                    max_keepalive_connections=settings.meilisearch_max_keepalive_connections,
+                    keepalive_expiry=settings.meilisearch_keepalive_expiry_seconds,
+                ),
+            )
+            self._loop = loop
+            logger.info(f"Created pooled async Meilisearch client for {self.url}")
+        return self._client
+
+    def _release_client(self) -> None:
+        """Close the client left on a previous event loop — only possible while that loop still runs."""
+        old_loop = self._loop
+        if old_loop is not None and old_loop.is_running() and not old_loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), old_loop)
+            return
+        logger.warning(
+            "Dropping async Meilisearch client left on a finished event loop without closing it "
+            "— call async_search_client.aclose() before the loop ends"
+        )
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+    async def _post(
+        self, operation: str, path: str, body: Dict[str, Any], timeout: Optional[float]
+    ) -> Dict[str, Any]:
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        started = time.perf_counter()
+        try:
+            response = await self.client.post(path, json=body, **kwargs)
+        finally:
+            MEILISEARCH_LATENCY.observe(time.perf_counter() - started, operation)
+        response.raise_for_status()
+        return response.json()
+
+    async def search(
+        self,
+        index_uid: str,
+        query: str,
+        params: Dict[str, Any],
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """POST /indexes/{uid}/search — same params dict as meilisearch.Index.search."""
+        body = {"q": query, **params}
+        return await self._post("search", f"/indexes/{quote(index_uid, safe='')}/search", body, timeout)
+
+    async def multi_search(
+        self,
+        queries: List[Dict[str, Any]],
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """POST /multi-search — each query carries its own indexUid; results keep query order."""
+        return await self._post("multi_search", "/multi-search", {"queries": queries}, timeout)
+
+
+async_search_client = AsyncMeilisearchClient(settings.meilisearch_url, settings.meilisearch_master_key)
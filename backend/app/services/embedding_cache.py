@@ -0,0 +1,272 @@
+"""
+Embedding Cache
+───────────────
+Two-tier, content-addressed cache for text embeddings.
+
+  1. In-process LRU  — hot vectors, no I/O at all
+  2. SQLite on disk  — survives restarts, shared by the API, eval and ingest scripts
+
+Entries are keyed by sha256(model + normalized text), so the same query
+embedded by a different model never collides. Vectors are stored as packed
+float32 blobs (6 KB for a 1536-dim vector instead of ~30 KB of JSON).
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from app.config.settings import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC, trimmed, single-spaced."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    """Content address for (model, text)."""
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU in front of a SQLite store.
+    Both tiers honour the same TTL; the disk tier is additionally capped
+    at `max_rows` (least recently used rows are pruned first).
+    """
+
+    # Prune the disk tier every N writes instead of on every insert
+    _PRUNE_EVERY = 256
+
+    def __init__(
+        self,
+        path: Optional[str],
+        memory_size: int = 2048,
+        max_rows: int = 100_000,
+        ttl_seconds: int = 30 * 24 * 3600,
+    ):
+        self.path        = path
+        self.memory_size = memory_size
+        self.max_rows    = max_rows
+        self.ttl_seconds = ttl_seconds
+
+        self._lock   = threading.Lock()
+        self._memory: "OrderedDict[str, tuple[float, List[float]]]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes_since_prune = 0
+
+        self.memory_hits = 0
+        self.disk_hits   = 0
+        self.misses      = 0
+        self.evictions   = 0
+
+        if path:
+            self._open_disk(path)
+
+    # ── Disk tier ──────────────────────────────────────────────────────────────
+
+    def _open_disk(self, path: str) -> None:
+        try:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key         TEXT PRIMARY KEY,
+                    model       TEXT NOT NULL,
+                    dim         INTEGER NOT NULL,
+                    vector      BLOB NOT NULL,
+                    created_at  REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_accessed ON embeddings (accessed_at)")
+            self._conn = conn
+            logger.info(f"Embedding cache opened at {path}")
+        except Exception as e:
+            # The cache is an optimisation — never take the service down with it
+            logger.error(f"Embedding cache disabled (could not open {path}): {e}")
+            self._conn = None
+
+    @staticmethod
+    def _pack(vector: List[float]) -> bytes:
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _unpack(blob: bytes) -> List[float]:
+        vec = array("f")
+        vec.frombytes(blob)
+        return vec.tolist()
+
+    def _disk_get(self, key: str, now: float) -> Optional[List[float]]:
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT vector, created_at FROM embeddings WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        blob, created_at = row
+        if self.ttl_seconds and now - created_at > self.ttl_seconds:
+            self._conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+            self.evictions += 1
+            return None
+        self._conn.execute("UPDATE embeddings SET accessed_at = ? WHERE key = ?", (now, key))
+        return self._unpack(blob)
+
+    def _disk_put_many(self, rows: List[tuple], now: float) -> None:
+        if self._conn is None or not rows:
+            return
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(key, model, len(vec), self._pack(vec), now, now) for key, model, vec in rows],
+        )
+        self._writes_since_prune += len(rows)
+        if self._writes_since_prune >= self._PRUNE_EVERY:
+            self._prune_disk(now)
+
+    def _prune_disk(self, now: float) -> None:
+        self._writes_since_prune = 0
+        removed = 0
+        if self.ttl_seconds:
+            removed += self._conn.execute(
+                "DELETE FROM embeddings WHERE created_at < ?", (now - self.ttl_seconds,)
+            ).rowcount
+        if self.max_rows:
+            removed += self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                "  SELECT key FROM embeddings ORDER BY accessed_at DESC LIMIT -1 OFFSET ?"
+                ")",
+                (self.max_rows,),
+            ).rowcount
+        if removed:
+            self.evictions += removed
+            logger.info(f"Embedding cache pruned {removed} disk entries")
+
+    # ── Memory tier ────────────────────────────────────────────────────────────
+
+    def _memory_get(self, key: str, now: float) -> Optional[List[float]]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        created_at, vector = entry
+        if self.ttl_seconds and now - created_at > self.ttl_seconds:
+            del self._memory[key]
+            self.evictions += 1
+            return None
+        self._memory.move_to_end(key)
+        return vector
+
+    def _memory_put(self, key: str, vector: List[float], created_at: float) -> None:
+        self._memory[key] = (created_at, vector)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    # ── Public API ─────────────────────────────────────────────────────────────
+
+    @property
+    def has_disk(self) -> bool:
+        return self._conn is not None
+
+    def get_memory_many(self, model: str, texts: List[str]) -> Dict[int, List[float]]:
+        """
+        Memory-tier-only lookup — never touches disk, safe to call on the event loop.
+        Misses are not counted here; follow up with get_many() for the remainder.
+        """
+        found: Dict[int, List[float]] = {}
+        now = time.time()
+        with self._lock:
+            for i, text in enumerate(texts):
+                vector = self._memory_get(cache_key(model, text), now)
+                if vector is not None:
+                    self.memory_hits += 1
+                    found[i] = vector
+        return found
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, List[float]]:
+        """
+        Look up every text. Returns {position: vector} for the hits only;
+        positions missing from the result must be embedded by the caller.
+        """
+        found: Dict[int, List[float]] = {}
+        now = time.time()
+        with self._lock:
+            for i, text in enumerate(texts):
+                key = cache_key(model, text)
+                vector = self._memory_get(key, now)
+                if vector is not None:
+                    self.memory_hits += 1
+                    found[i] = vector
+                    continue
+                try:
+                    vector = self._disk_get(key, now)
+                except sqlite3.Error as e:
+                    logger.warning(f"Embedding cache disk read failed: {e}")
+                    vector = None
+                if vector is not None:
+                    self.disk_hits += 1
+                    self._memory_put(key, vector, now)
+                    found[i] = vector
+                else:
+                    self.misses += 1
+        return found
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]) -> None:
+        """Store freshly computed vectors in both tiers."""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = cache_key(model, text)
+                self._memory_put(key, vector, now)
+                rows.append((key, model, vector))
+            try:
+                self._disk_put_many(rows, now)
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding cache disk write failed: {e}")
+
+    def clear(self) -> None:
+        """Drop every cached vector from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM embeddings")
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters for logging and the metrics endpoint."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits":  self.memory_hits,
+            "disk_hits":    self.disk_hits,
+            "misses":       self.misses,
+            "evictions":    self.evictions,
+            "memory_items": len(self._memory),
+            "hit_rate":     round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+def build_embedding_cache() -> Optional[EmbeddingCache]:
+    """Create the cache from settings, or None when caching is disabled."""
+    if not settings.embedding_cache_enabled:
+        return None
+    return EmbeddingCache(
+        path=settings.embedding_cache_path or None,
+        memory_size=settings.embedding_cache_memory_size,
+        max_rows=settings.embedding_cache_max_rows,
+        ttl_seconds=settings.embedding_cache_ttl_seconds,
+    )
@@ -1,34 +1,267 @@
-
+import asyncio
 import logging
-from typing import List, Union
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
 
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI, OpenAI
 
 from app.config.settings import settings
+from app.services.embedding_cache import build_embedding_cache
 from app.utils.logger import get_logger
+from app.utils.metrics import OPENAI_LATENCY, metrics, record_openai_usage
 
 logger = get_logger(__name__)
 
 
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.openai_max_connections,
+        max_keepalive_connections=settings.openai_max_keepalive_connections,
+        keepalive_expiry=settings.openai_keepalive_expiry_seconds,
+    )
+
+
+class _EmbeddingBatcher:
+    """
+    Coalesces concurrent embed requests into a single embeddings.create call.
+
+    The first request opens a short window (embedding_batch_window_ms); every
+    request that arrives before it closes — or until max_inputs texts are
+    queued — rides along in the same API call. Each caller awaits its own
+    futures, so results are routed back per request and one caller's
+    cancellation doesn't affect the others.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], Awaitable[List[List[float]]]],
+        window_seconds: float,
+        max_inputs: int,
+    ):
+        self._embed_fn   = embed_fn
+        self.window      = window_seconds
+        self.max_inputs  = max(1, max_inputs)
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Futures from a previous (closed) loop can never be resolved
+            self._pending = []
+            self._timer   = None
+            self._loop    = loop
+
+        futures = []
+        for text in texts:
+            fut = loop.create_future()
+            self._pending.append((text, fut))
+            futures.append(fut)
+
+        if len(self._pending) >= self.max_inputs:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        for start in range(0, len(batch), self.max_inputs):
+            task = asyncio.ensure_future(self._run(batch[start:start + self.max_inputs]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        # Identical texts from different callers are embedded once
+        positions: Dict[str, int] = {}
+        for text, _ in batch:
+            positions.setdefault(text, len(positions))
+        unique = list(positions)
+
+        try:
+            vectors = await self._embed_fn(unique)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        if len(batch) > 1:
+            logger.debug(f"Embedding batch flushed: {len(batch)} request(s), {len(unique)} unique input(s)")
+        for text, fut in batch:
+            if not fut.done():
+                fut.set_result(vectors[positions[text]])
+
+
 class EmbeddingService:
     """
     Text-only embedding service using OpenAI text-embedding-3-small (1536-dim).
     SigLIP / image embeddings have been intentionally removed.
+    Vectors are served from the two-tier embedding cache when possible.
     """
 
+    def __init__(self):
+        self.model = settings.embedding_model
+        self.cache = build_embedding_cache()
+        self._client: Optional[OpenAI] = None
+        # httpx async pools are bound to the event loop that created them, so the
+        # async client is rebuilt if a script runs several asyncio.run() calls.
+        self._async_client: Optional[AsyncOpenAI] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._batcher = _EmbeddingBatcher(
+            self._embed_uncached_async,
+            window_seconds=settings.embedding_batch_window_ms / 1000,
+            max_inputs=settings.embedding_batch_max_inputs,
+        )
+
+    # ── Shared clients ─────────────────────────────────────────────────────────
+
+    @property
+    def client(self) -> OpenAI:
+        if self._client is None:
+            self._client = OpenAI(
+                api_key=settings.openai_api_key,
+                timeout=settings.openai_timeout_seconds,
+                http_client=httpx.Client(
+                    limits=_http_limits(),
+                    timeout=settings.openai_timeout_seconds,
+                ),
+            )
+        return self._client
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            if self._async_client is not None:
+                self._release_async_client()
+            self._async_client = AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                timeout=settings.openai_timeout_seconds,
+                http_client=httpx.AsyncClient(
+                    limits=_http_limits(),
+                    timeout=settings.openai_timeout_seconds,
+                ),
+            )
+            self._async_loop = loop
+            logger.info("Created pooled AsyncOpenAI client for embeddings")
+        return self._async_client
+
+    def _release_async_client(self) -> None:
+        """Close the client left on a previous event loop — only possible while that loop still runs."""
+        old_loop = self._async_loop
+        if old_loop is not None and old_loop.is_running() and not old_loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._async_client.close(), old_loop)
+            return
+        logger.warning(
+            "Dropping AsyncOpenAI client left on a finished event loop without closing it "
+            "— call embedding_service.aclose() before the loop ends"
+        )
+
+    async def aclose(self) -> None:
+        """Close the pooled async client (called on app shutdown)."""
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+            self._async_loop = None
+
+    # ── Sync path ──────────────────────────────────────────────────────────────
+
+    def _embed_uncached(self, inputs: List[str]) -> List[List[float]]:
+        started  = time.perf_counter()
+        response = self.client.embeddings.create(input=inputs, model=self.model)
+        OPENAI_LATENCY.observe(time.perf_counter() - started, "embeddings")
+        record_openai_usage("embeddings", response.usage)
+        return [data.embedding for data in response.data]
+
     def embed_text(self, text: Union[str, List[str]]) -> Union[List[float], List[List[float]]]:
         """
         Generate semantic text embeddings using OpenAI.
         Accepts a single string or a list of strings (batch mode).
+        Only cache misses are sent to the API.
         """
         try:
-            client = OpenAI(api_key=settings.openai_api_key)
+            is_single = isinstance(text, str)
+            inputs    = [text] if is_single else text
+
+            cached = self.cache.get_many(self.model, inputs) if self.cache else {}
+            missing = [i for i in range(len(inputs)) if i not in cached]
+
+            if missing:
+                fresh = self._embed_uncached([inputs[i] for i in missing])
+                if self.cache:
+                    self.cache.put_many(self.model, [inputs[i] for i in missing], fresh)
+                cached.update(zip(missing, fresh))
+            else:
+                logger.debug(f"Embedding cache hit for {len(inputs)} input(s)")
+
+            embeddings = [cached[i] for i in range(len(inputs))]
+            return embeddings[0] if is_single else embeddings
+
+        except Exception as e:
+            logger.error(f"Error embedding text with OpenAI: {e}")
+            raise e
+
+    # ── Async path ─────────────────────────────────────────────────────────────
+
+    async def _embed_uncached_async(self, inputs: List[str]) -> List[List[float]]:
+        started  = time.perf_counter()
+        response = await self.async_client.embeddings.create(input=inputs, model=self.model)
+        OPENAI_LATENCY.observe(time.perf_counter() - started, "embeddings")
+        record_openai_usage("embeddings", response.usage)
+        return [data.embedding for data in response.data]
 
+    async def _cache_lookup_async(self, inputs: List[str]) -> Dict[int, List[float]]:
+        """Memory tier inline; only the disk tier is pushed to a worker thread."""
+        if not self.cache:
+            return {}
+        found = self.cache.get_memory_many(self.model, inputs)
+        missing = [i for i in range(len(inputs)) if i not in found]
+        if not missing:
+            return found
+        rest = [inputs[i] for i in missing]
+        if self.cache.has_disk:
+            from_disk = await asyncio.to_thread(self.cache.get_many, self.model, rest)
+        else:
+            from_disk = self.cache.get_many(self.model, rest)
+        found.update({missing[j]: vec for j, vec in from_disk.items()})
+        return found
+
+    async def embed_text_async(self, text: Union[str, List[str]]) -> Union[List[float], List[List[float]]]:
+        """
+        Async twin of embed_text() for request handlers.
+        Uses the shared AsyncOpenAI client — no worker thread, no new TLS handshake.
+        """
+        try:
             is_single = isinstance(text, str)
             inputs    = [text] if is_single else text
 
-            response   = client.embeddings.create(input=inputs, model="text-embedding-3-small")
-            embeddings = [data.embedding for data in response.data]
+            cached = await self._cache_lookup_async(inputs)
+            missing = [i for i in range(len(inputs)) if i not in cached]
+
+            if missing:
+                to_embed = [inputs[i] for i in missing]
+                if settings.embedding_batching_enabled:
+                    fresh = await self._batcher.submit(to_embed)
+                else:
+                    fresh = await self._embed_uncached_async(to_embed)
+                if self.cache:
+                    if self.cache.has_disk:
+                        await asyncio.to_thread(self.cache.put_many, self.model, to_embed, fresh)
+                    else:
+                        self.cache.put_many(self.model, to_embed, fresh)
+                cached.update(zip(missing, fresh))
+            else:
+                logger.debug(f"Embedding cache hit for {len(inputs)} input(s)")
+
+            embeddings = [cached[i] for i in range(len(inputs))]
             return embeddings[0] if is_single else embeddings
 
         except Exception as e:
@@ -38,3 +271,25 @@ class EmbeddingService:
 
 # Singleton instance
 embedding_service = EmbeddingService()
+
+
+def _cache_lookups():
+    stats = embedding_service.cache.stats() if embedding_service.cache else {}
+    yield ("memory_hit",), stats.get("memory_hits", 0)
+    yield ("disk_hit",),   stats.get("disk_hits", 0)
+    yield ("miss",),       stats.get("misses", 0)
+
+
+def _cache_hit_ratio():
+    stats = embedding_service.cache.stats() if embedding_service.cache else {}
+    yield (), stats.get("hit_rate", 0.0)
+
+
+metrics.callback(
+    "embedding_cache_lookups_total", "Embedding cache lookups by outcome.",
+    ["result"], _cache_lookups, type_name="counter",
+)
+metrics.callback(
+    "embedding_cache_hit_ratio", "Lifetime embedding cache hit ratio (memory + disk).",
+    [], _cache_hit_ratio,
+)
@@ -0,0 +1,437 @@
+"""
+Image Cache
+───────────
+Two-tier cache for product card images, keyed by image URL.
+
+  1. In-process LRU  — hot images, no I/O at all (bounded by total bytes)
+  2. SQLite on disk  — survives restarts
+
+Each entry keeps the bytes, MIME type and the validators the CDN sent
+(ETag / Last-Modified), and optionally the pre-encoded base64 payload the WA
+Platform expects, so a repeat dispatch skips both the download and the encode.
+
+An entry younger than image_cache_fresh_seconds is served as-is. An older one
+is revalidated with a conditional GET: 304 just renews it, 200 replaces it, and
+if the CDN can't be reached the stale copy is served rather than no card.
+
+Derived variants (see image_transform) are cached under (url, variant) instead
+of the original, carrying the original's validators.
+"""
+import asyncio
+import base64
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+
+import httpx
+
+from app.config.settings import settings
+from app.utils.logger import get_logger
+from app.utils.metrics import metrics
+from app.utils.retry import retry_async
+
+logger = get_logger(__name__)
+
+
+class CachedImage(NamedTuple):
+    mime_type: str
+    data: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float              # Last time the CDN confirmed these bytes (200 or 304)
+    b64: Optional[str] = None      # Pre-encoded payload, when image_cache_store_base64 is on
+    source_size: Optional[int] = None  # Bytes as downloaded, when `data` is a transformed variant
+
+    @property
+    def size(self) -> int:
+        return len(self.data) + len(self.b64 or "")
+
+    @property
+    def bytes_saved(self) -> int:
+        return max(0, self.source_size - len(self.data)) if self.source_size else 0
+
+    def base64(self) -> str:
+        return self.b64 if self.b64 is not None else base64.b64encode(self.data).decode("utf-8")
+
+    def with_base64(self) -> "CachedImage":
+        return self if self.b64 is not None else self._replace(b64=self.base64())
+
+
+# Turns a downloaded image into a derived variant (e.g. resized + re-encoded)
+ImageTransform = Callable[[CachedImage], Awaitable[CachedImage]]
+
+
+def normalize_image_url(url: Optional[str]) -> Optional[str]:
+    """The URL as fetched and cached (surrounding whitespace dropped); None if blank."""
+    url = (url or "").strip()
+    return url or None
+
+
+def cache_key(url: str, variant: str = "") -> str:
+    """Storage key for a URL, or for one derived variant of it."""
+    return f"{url}\x00{variant}" if variant else url
+
+
+def _from_response(res: httpx.Response) -> CachedImage:
+    return CachedImage(
+        # Detect MIME type from response headers (e.g. "image/jpeg", "image/png")
+        mime_type=res.headers.get("content-type", "image/jpeg").split(";")[0].strip(),
+        data=res.content,
+        etag=res.headers.get("etag"),
+        last_modified=res.headers.get("last-modified"),
+        fetched_at=time.time(),
+    )
+
+
+class ImageCache:
+    """
+    Thread-safe, byte-bounded LRU in front of a SQLite store. Both tiers drop
+    least recently used images once over their byte budget.
+    """
+
+    # Prune the disk tier every N writes instead of on every insert
+    _PRUNE_EVERY = 64
+
+    def __init__(
+        self,
+        path: Optional[str],
+        memory_max_bytes: int = 64 * 1024 * 1024,
+        disk_max_bytes: int = 1024 * 1024 * 1024,
+        max_item_bytes: int = 10 * 1024 * 1024,
+        fresh_seconds: int = 24 * 3600,
+        store_base64: bool = True,
+    ):
+        self.path             = path
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes   = disk_max_bytes
+        self.max_item_bytes   = max_item_bytes
+        self.fresh_seconds    = fresh_seconds
+        self.store_base64     = store_base64
+
+        self._lock   = threading.Lock()
+        self._memory: "OrderedDict[str, CachedImage]" = OrderedDict()
+        self._memory_bytes = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes_since_prune = 0
+
+        self.memory_hits = 0
+        self.disk_hits   = 0
+        self.revalidated = 0
+        self.stale_served = 0
+        self.misses      = 0
+
+        if path:
+            self._open_disk(path)
+
+    # ── Disk tier ──────────────────────────────────────────────────────────────
+
+    def _open_disk(self, path: str) -> None:
+        try:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS images (
+                    url           TEXT PRIMARY KEY,
+                    mime_type     TEXT NOT NULL,
+                    etag          TEXT,
+                    last_modified TEXT,
+                    data          BLOB NOT NULL,
+                    b64           TEXT,
+                    size          INTEGER NOT NULL,
+                    fetched_at    REAL NOT NULL,
+                    accessed_at   REAL NOT NULL,
+                    source_size   INTEGER
+                )
+                """
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(images)")}
+            if "source_size" not in columns:
+                conn.execute("ALTER TABLE images ADD COLUMN source_size INTEGER")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_images_accessed ON images (accessed_at)")
+            self._conn = conn
+            logger.info(f"Image cache opened at {path}")
+        except Exception as e:
+            # The cache is an optimisation — never take the service down with it
+            logger.error(f"Image cache disk tier disabled (could not open {path}): {e}")
+            self._conn = None
+
+    def _disk_get(self, url: str, now: float) -> Optional[CachedImage]:
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT mime_type, data, etag, last_modified, fetched_at, b64, source_size FROM images WHERE url = ?",
+            (url,),
+        ).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE images SET accessed_at = ? WHERE url = ?", (now, url))
+        image = CachedImage(*row)
+        return image.with_base64() if self.store_base64 else image
+
+    def _disk_put(self, url: str, image: CachedImage, now: float) -> None:
+        if self._conn is None:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO images "
+            "(url, mime_type, etag, last_modified, data, b64, size, fetched_at, accessed_at, source_size) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (url, image.mime_type, image.etag, image.last_modified, image.data, image.b64,
+             image.size, image.fetched_at, now, image.source_size),
+        )
+        self._writes_since_prune += 1
+        if self._writes_since_prune >= self._PRUNE_EVERY:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        self._writes_since_prune = 0
+        if not self.disk_max_bytes:
+            return
+        # Keep the most recently used images that fit in the byte budget
+        removed = self._conn.execute(
+            "DELETE FROM images WHERE url IN ("
+            "  SELECT url FROM ("
+            "    SELECT url, SUM(size) OVER (ORDER BY accessed_at DESC ROWS UNBOUNDED PRECEDING) AS running"
+            "    FROM images"
+            "  ) WHERE running > ?"
+            ")",
+            (self.disk_max_bytes,),
+        ).rowcount
+        if removed:
+            logger.info(f"Image cache pruned {removed} disk entries")
+
+    # ── Memory tier ────────────────────────────────────────────────────────────
+
+    def _memory_put(self, url: str, image: CachedImage) -> None:
+        previous = self._memory.pop(url, None)
+        if previous is not None:
+            self._memory_bytes -= previous.size
+        if image.size > self.memory_max_bytes:
+            return
+        self._memory[url] = image
+        self._memory_bytes += image.size
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.size
+
+    # ── Storage API (sync — disk calls belong in a worker thread) ──────────────
+
+    def get_memory(self, url: str) -> Optional[CachedImage]:
+        """Memory-tier-only lookup — never touches disk, safe to call on the event loop."""
+        with self._lock:
+            image = self._memory.get(url)
+            if image is not None:
+                self._memory.move_to_end(url)
+            return image
+
+    def get(self, url: str) -> Optional[CachedImage]:
+        """Memory tier, then disk (promoting disk hits into memory)."""
+        with self._lock:
+            image = self._memory.get(url)
+            if image is not None:
+                self._memory.move_to_end(url)
+                return image
+            try:
+                image = self._disk_get(url, time.time())
+            except sqlite3.Error as e:
+                logger.warning(f"Image cache disk read failed: {e}")
+                image = None
+            if image is not None:
+                self._memory_put(url, image)
+            return image
+
+    def put(self, url: str, image: CachedImage) -> None:
+        if len(image.data) > self.max_item_bytes:
+            return
+        with self._lock:
+            self._memory_put(url, image)
+            try:
+                self._disk_put(url, image, time.time())
+            except sqlite3.Error as e:
+                logger.warning(f"Image cache disk write failed: {e}")
+
+    def renew(self, url: str, image: CachedImage) -> None:
+        """Record a 304 — same bytes, new fetched_at — without rewriting the blob."""
+        with self._lock:
+            self._memory_put(url, image)
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute(
+                    "UPDATE images SET fetched_at = ?, accessed_at = ? WHERE url = ?",
+                    (image.fetched_at, time.time(), url),
+                )
+            except sqlite3.Error as e:
+                logger.warning(f"Image cache disk write failed: {e}")
+
+    def is_fresh(self, image: CachedImage) -> bool:
+        return time.time() - image.fetched_at < self.fresh_seconds
+
+    def clear(self) -> None:
+        """Drop every cached image from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM images")
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters for logging and the metrics endpoint."""
+        return {
+            "memory_hits":  self.memory_hits,
+            "disk_hits":    self.disk_hits,
+            "revalidated":  self.revalidated,
+            "stale_served": self.stale_served,
+            "misses":       self.misses,
+            "memory_items": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+        }
+
+    # ── Fetch API (async) ──────────────────────────────────────────────────────
+
+    async def fetch(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        attempts: int = 2,
+        label: str = "",
+        variant: str = "",
+        transform: Optional[ImageTransform] = None,
+    ) -> CachedImage:
+        """
+        Return the image for `url`, downloading or revalidating only when needed.
+        With a `variant`, the downloaded image is passed through `transform` and
+        only the result is cached, under (url, variant). It keeps the source's
+        validators, so a 304 for the URL still proves the variant current.
+        Raises like the underlying download when there is no usable copy.
+        """
+        key = cache_key(url, variant)
+        cached = self.get_memory(key)
+        if cached is not None and self.is_fresh(cached):
+            self.memory_hits += 1
+            return cached
+        if cached is None and self.path:
+            cached = await asyncio.to_thread(self.get, key)
+            if cached is not None and self.is_fresh(cached):
+                self.disk_hits += 1
+                return cached
+
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        try:
+            res = await retry_async(
+                lambda: client.get(url, headers=headers),
+                retries=attempts,
+                delay=1.0,
+                exceptions=(httpx.RequestError, httpx.TimeoutException),
+                label=label or f"image-download [{url}]",
+            )
+            if res.status_code == 304 and cached is not None:
+                self.revalidated += 1
+                image = cached._replace(fetched_at=time.time())
+                await self._store(self.renew, key, image)
+                return image
+            res.raise_for_status()
+        except (httpx.RequestError, httpx.HTTPStatusError) as e:
+            # Serve the stale copy when the CDN is unreachable or failing, not when it says 4xx
+            client_error = isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500
+            if cached is None or client_error:
+                raise
+            self.stale_served += 1
+            logger.warning(f"Image revalidation failed, serving stale copy | url={url} | error={e}")
+            return cached
+
+        self.misses += 1
+        image = _from_response(res)
+        if transform is not None:
+            image = await transform(image)
+        if self.store_base64:
+            image = image.with_base64()
+        await self._store(self.put, key, image)
+        return image
+
+    async def _store(self, fn, url: str, image: CachedImage) -> None:
+        # Disk writes go to a worker thread; memory-only writes are instant
+        if self.path:
+            await asyncio.to_thread(fn, url, image)
+        else:
+            fn(url, image)
+
+
+def build_image_cache() -> Optional[ImageCache]:
+    """Create the cache from settings, or None when caching is disabled."""
+    if not settings.image_cache_enabled:
+        return None
+    return ImageCache(
+        path=settings.image_cache_path or None,
+        memory_max_bytes=settings.image_cache_memory_max_bytes,
+        disk_max_bytes=settings.image_cache_disk_max_bytes,
+        max_item_bytes=settings.image_cache_max_item_bytes,
+        fresh_seconds=settings.image_cache_fresh_seconds,
+        store_base64=settings.image_cache_store_base64,
+    )
+
+
+# Singleton instance (None when IMAGE_CACHE_ENABLED=false)
+image_cache = build_image_cache()
+
+
+async def fetch_image(
+    client: httpx.AsyncClient,
+    url: str,
+    attempts: int = 2,
+    label: str = "",
+    variant: str = "",
+    transform: Optional[ImageTransform] = None,
+) -> CachedImage:
+    """Fetch a product image through image_cache, or straight from the CDN when it is disabled."""
+    url = normalize_image_url(url) or url
+    if image_cache is not None:
+        return await image_cache.fetch(
+            client, url, attempts=attempts, label=label, variant=variant, transform=transform
+        )
+    res = await retry_async(
+        lambda: client.get(url),
+        retries=attempts,
+        delay=1.0,
+        exceptions=(httpx.RequestError, httpx.TimeoutException),
+        label=label or f"image-download [{url}]",
+    )
+    res.raise_for_status()
+    image = _from_response(res)
+    return await transform(image) if transform is not None else image
+
+
+def _image_cache_lookups():
+    stats = image_cache.stats() if image_cache else {}
+    yield ("memory_hit",),  stats.get("memory_hits", 0)
+    yield ("disk_hit",),    stats.get("disk_hits", 0)
+    yield ("revalidated",), stats.get("revalidated", 0)
+    yield ("stale",),       stats.get("stale_served", 0)
+    yield ("miss",),        stats.get("misses", 0)
+
+
+def _image_cache_bytes():
+    stats = image_cache.stats() if image_cache else {}
+    yield (), stats.get("memory_bytes", 0)
+
+
+metrics.callback(
+    "image_cache_lookups_total", "Product image cache lookups by outcome.",
+    ["result"], _image_cache_lookups, type_name="counter",
+)
+metrics.callback(
+    "image_cache_memory_bytes", "Bytes held in the in-process image LRU.",
+    [], _image_cache_bytes,
+)
@@ -0,0 +1,104 @@
+"""
+Image Prewarm
+─────────────
+Optional catalog-ingestion stage that loads every product's card image into the
+image cache ahead of the first dispatch, exactly as send_product_messages will
+send it (downloaded, transformed when that stage is on, base64 pre-encoded).
+
+A fixed number of workers pull URLs from the de-duplicated list, so at most
+that many downloads are in flight. Images already fresh in the cache are
+skipped without a request, which makes the stage resumable: an interrupted run
+picks up where it stopped, and a re-sync only downloads new or expired images.
+URLs are normalized with the same helper dispatch uses, so both read one key.
+"""
+import asyncio
+import time
+from typing import Dict, Iterable, Optional
+
+import httpx
+
+from app.config.settings import settings
+from app.services.image_cache import cache_key, image_cache, normalize_image_url
+from app.services.image_transform import fetch_dispatch_image, image_transformer
+from app.utils.http_clients import http_clients
+from app.utils.logger import get_logger
+from app.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+IMAGES_PREWARMED = metrics.counter(
+    "product_images_prewarmed_total", "Product images handled by the ingestion prewarm stage.",
+    ["outcome"],
+)
+
+# Progress is logged every N images
+_LOG_EVERY = 100
+
+
+async def _is_cached(url: str) -> bool:
+    """True if the dispatch-ready variant of `url` is already fresh in the cache."""
+    key = cache_key(url, image_transformer.profile or "")
+    cached = image_cache.get_memory(key)
+    if cached is None and image_cache.path:
+        cached = await asyncio.to_thread(image_cache.get, key)
+    return cached is not None and image_cache.is_fresh(cached)
+
+
+async def prewarm_images(
+    urls: Iterable[Optional[str]],
+    concurrency: Optional[int] = None,
+    attempts: Optional[int] = None,
+    client: Optional[httpx.AsyncClient] = None,
+) -> Dict[str, int]:
+    """
+    Fetch, transform and cache the given image URLs (blanks and duplicates ignored),
+    through `client` or the shared product_images client. Returns counts per outcome:
+    warmed, cached (already fresh — skipped), failed.
+    """
+    counts = {"warmed": 0, "cached": 0, "failed": 0}
+    if image_cache is None:
+        logger.warning("⚠️  Image prewarm skipped — IMAGE_CACHE_ENABLED is false")
+        return counts
+
+    pending = list(dict.fromkeys(filter(None, map(normalize_image_url, urls))))
+    total   = len(pending)
+    workers = max(1, min(concurrency or settings.image_prewarm_concurrency, total or 1))
+    attempts = attempts or settings.product_image_download_attempts
+    if not pending:
+        return counts
+
+    logger.info(
+        f"━━━ 🔥 Image prewarm — {total} image(s), {workers} worker(s), "
+        f"profile={image_transformer.profile or 'original'} ━━━"
+    )
+    start  = time.perf_counter()
+    queue  = iter(pending)   # Shared by the workers; safe since next() never awaits
+
+    async def _worker(client: httpx.AsyncClient) -> None:
+        for url in queue:
+            if await _is_cached(url):
+                outcome = "cached"
+            else:
+                try:
+                    await fetch_dispatch_image(client, url, attempts=attempts, label=f"image-prewarm [{url}]")
+                    outcome = "warmed"
+                except Exception as e:
+                    logger.warning(f"  ⚠️  Prewarm failed | url={url} | error={e}")
+                    outcome = "failed"
+            counts[outcome] += 1
+            IMAGES_PREWARMED.inc(outcome)
+            handled = sum(counts.values())
+            if handled % _LOG_EVERY == 0 and handled < total:
+                logger.info(f"  🔥 Prewarm progress {handled}/{total} — {counts}")
+
+    client = client or http_clients.get("product_images")
+    await asyncio.gather(*(_worker(client) for _ in range(workers)))
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"✅ Image prewarm done in {elapsed:.1f}s — warmed={counts['warmed']} "
+        f"already_cached={counts['cached']} failed={counts['failed']}"
+    )
+    if not image_cache.path:
+        logger.warning("⚠️  IMAGE_CACHE_PATH is empty — prewarmed images live in this process only")
+    return counts
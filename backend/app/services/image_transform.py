@@ -0,0 +1,128 @@
+"""
+Image Transform
+───────────────
+Optional resize + re-encode of product card images before dispatch.
+
+Shopify CDN originals are often several MB; WhatsApp shows them at phone
+size anyway, and every byte is sent again as base64 (+33%) in the JSON POST.
+With image_transform_enabled, images are scaled down to
+image_transform_max_dimension on the longest side and re-encoded as JPEG or
+WebP at image_transform_quality — in a worker pool, off the event loop.
+
+Results are cached per (url, profile) through the image cache, so each image
+is transformed once per profile. Needs Pillow (pip install pillow); without
+it the stage is skipped and originals are sent.
+"""
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import httpx
+
+from app.config.settings import settings
+from app.services.image_cache import CachedImage, fetch_image
+from app.utils.logger import get_logger
+from app.utils.metrics import metrics
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional dependency
+    Image = None
+
+logger = get_logger(__name__)
+
+IMAGES_TRANSFORMED = metrics.counter(
+    "product_images_transformed_total", "Product images run through the transform stage.",
+    ["outcome"],
+)
+
+_PIL_FORMATS = {"jpeg": "JPEG", "webp": "WEBP"}
+
+
+def _transform_sync(image: CachedImage, fmt: str, max_dimension: int, quality: int) -> CachedImage:
+    """Resize + re-encode (CPU bound — runs in the worker pool). Keeps the original if that's smaller."""
+    with Image.open(io.BytesIO(image.data)) as src:
+        src = ImageOps.exif_transpose(src)   # Bake in camera rotation before the metadata is dropped
+        resized = max(src.size) > max_dimension
+        if resized:
+            src.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+        if fmt == "jpeg" and src.mode != "RGB":
+            # JPEG has no alpha — flatten transparent PNGs onto white, not black
+            rgba = src.convert("RGBA")
+            flat = Image.new("RGB", rgba.size, (255, 255, 255))
+            flat.paste(rgba, mask=rgba.getchannel("A"))
+            src = flat
+        out = io.BytesIO()
+        src.save(out, format=_PIL_FORMATS[fmt], quality=quality, optimize=True)
+
+    data = out.getvalue()
+    source_size = len(image.data)
+    if not resized and len(data) >= source_size:
+        IMAGES_TRANSFORMED.inc("kept_original")
+        return image._replace(source_size=source_size)
+    IMAGES_TRANSFORMED.inc("transformed")
+    return image._replace(mime_type=f"image/{fmt}", data=data, b64=None, source_size=source_size)
+
+
+class ImageTransformer:
+    """Runs the transform stage for the configured profile in a small worker pool."""
+
+    def __init__(self):
+        self._pool: Optional[ThreadPoolExecutor] = None
+        if settings.image_transform_enabled and Image is None:
+            logger.warning("⚠️  IMAGE_TRANSFORM_ENABLED is set but Pillow is not installed — sending original images")
+
+    @property
+    def profile(self) -> Optional[str]:
+        """Cache variant name for the current settings, or None when the stage is off."""
+        if not settings.image_transform_enabled or Image is None:
+            return None
+        return (
+            f"{settings.image_transform_format}-{settings.image_transform_max_dimension}"
+            f"-q{settings.image_transform_quality}"
+        )
+
+    async def transform(self, image: CachedImage) -> CachedImage:
+        """Transform off the event loop; the original is returned if Pillow can't read it."""
+        if self._pool is None:
+            # Pillow releases the GIL while decoding, resizing and encoding, so threads scale
+            self._pool = ThreadPoolExecutor(
+                max_workers=max(1, settings.image_transform_workers), thread_name_prefix="image-transform"
+            )
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._pool,
+                _transform_sync,
+                image,
+                settings.image_transform_format,
+                settings.image_transform_max_dimension,
+                settings.image_transform_quality,
+            )
+        except Exception as e:
+            IMAGES_TRANSFORMED.inc("failed")
+            logger.warning(f"Image transform failed, sending original ({image.mime_type}, {len(image.data):,} bytes): {e}")
+            return image
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# Singleton instance
+image_transformer = ImageTransformer()
+
+
+async def fetch_dispatch_image(client: httpx.AsyncClient, url: str, attempts: int = 2, label: str = "") -> CachedImage:
+    """The image exactly as it will be sent: cached, and transformed when the stage is on."""
+    profile = image_transformer.profile
+    return await fetch_image(
+        client,
+        url,
+        attempts=attempts,
+        label=label,
+        variant=profile or "",
+        transform=image_transformer.transform if profile else None,
+    )
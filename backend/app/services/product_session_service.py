@@ -0,0 +1,388 @@
+"""
+Product Session Service
+───────────────────────
+Per-turn view of a WhatsApp user's product session, backed by a write-behind
+LRU cache of hot sessions.
+
+A turn loads the session once, serves both the recent-products prompt
+context and the handle exclusion set from memory, buffers every product
+shown during the turn, and hands them back in one call at the end.
+
+With the cache enabled (product_session_cache_enabled) an active
+conversation never touches the database: sessions stay in an in-process
+LRU, and buffered products are written in batches by a background flusher
+— every product_session_flush_interval_seconds, or sooner once
+product_session_flush_dirty_threshold sessions are dirty. Everything still
+dirty is written on shutdown. The cache is per process, so it is off by
+default: with several workers each would serve its own stale view of the
+shown handles and overwrite the others' appends. Enable it only for a
+single-worker deployment. Each cached session keeps at most the newest
+product_session_max_products handles, the same window the sweeper leaves
+in the table.
+
+A second background task sweeps the table: sessions idle longer than
+product_session_ttl_seconds are deleted and phones holding more than
+product_session_max_products rows are compacted, in batched DELETEs.
+"""
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.config.settings import settings
+from app.database.engine import AsyncSessionLocal, SessionLocal
+from app.database.repositories.product_session_repository import (
+    AsyncProductSessionRepository,
+    ProductSessionRepository,
+)
+from app.utils.logger import get_logger
+from app.utils.metrics import metrics
+
+logger = get_logger(__name__)
+
+SESSIONS_SWEPT = metrics.counter(
+    "product_sessions_swept_total", "Product sessions removed or trimmed by the sweeper.",
+    ["action"],
+)
+
+
+def _merge_handles(handles: List[str], products: List[Dict]) -> List[str]:
+    """Apply an append to a handle list — last occurrence wins, matching append_products."""
+    new = list(reversed(dict.fromkeys(
+        p["handle"] for p in reversed(products) if p.get("handle")
+    )))
+    if not new:
+        return handles
+    new_set = set(new)
+    return [h for h in handles if h not in new_set] + new
+
+
+def _merge_recent(recent: List[Dict], products: List[Dict], limit: int) -> List[Dict]:
+    """Apply an append to the recent-products window."""
+    new_set = {p["handle"] for p in products if p.get("handle")}
+    merged = [p for p in recent if not p.get("handle") or p["handle"] not in new_set]
+    seen: set = set()
+    tail: List[Dict] = []
+    for p in reversed(products):
+        handle = p.get("handle")
+        if handle:
+            if handle in seen:
+                continue
+            seen.add(handle)
+        tail.append(p)
+    merged.extend(reversed(tail))
+    return merged[-limit:] if limit > 0 else []
+
+
+def _cap_handles(handles: List[str]) -> List[str]:
+    """Keep the newest product_session_max_products handles (all of them when it's 0)."""
+    limit = settings.product_session_max_products
+    return handles[-limit:] if 0 < limit < len(handles) else handles
+
+
+class ProductSessionTurn:
+    """In-memory session state for one incoming message."""
+
+    def __init__(
+        self,
+        phone_number: str,
+        shown_handles: List[str],
+        recent_products: List[Dict],
+        commit: Callable[[str, List[Dict]], Awaitable[None]],
+    ):
+        self.phone_number    = phone_number
+        self.recent_products = recent_products
+        self._shown_handles  = shown_handles
+        self._pending: List[Dict] = []
+        self._commit = commit
+
+    @property
+    def shown_handles(self) -> List[str]:
+        """Handles shown before this turn plus any shown earlier in this turn."""
+        return _merge_handles(self._shown_handles, self._pending)
+
+    def add_products(self, products: List[Dict]) -> None:
+        """Buffer products shown during this turn — handed over by flush()."""
+        self._pending.extend(products)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._pending)
+
+    async def flush(self) -> int:
+        """Hand everything buffered this turn to the session store. Returns the number of products."""
+        if not self._pending:
+            return 0
+        pending = self._pending
+        await self._commit(self.phone_number, pending)
+        # Fold the saved products into the loaded view
+        self._shown_handles = self.shown_handles
+        self._pending = []
+        return len(pending)
+
+
+class _CachedSession:
+    __slots__ = ("handles", "recent", "pending")
+
+    def __init__(self, handles: List[str], recent: List[Dict]):
+        self.handles = _cap_handles(handles)
+        self.recent  = recent
+        # Products appended in memory but not yet written to the DB
+        self.pending: List[Dict] = []
+
+
+class ProductSessionService:
+    def __init__(self):
+        self.cache_enabled = settings.product_session_cache_enabled
+        if self.cache_enabled and settings.web_concurrency > 1:
+            logger.warning(
+                f"⚠️  PRODUCT_SESSION_CACHE_ENABLED with WEB_CONCURRENCY={settings.web_concurrency} — "
+                "the cache is per process; workers will overwrite each other's sessions"
+            )
+        self.max_size      = max(1, settings.product_session_cache_size)
+        self._cache: "OrderedDict[str, _CachedSession]" = OrderedDict()
+        # Guards the cache state below — flushes run in a worker thread
+        self._lock = threading.Lock()
+        self._dirty: set = set()
+        self._flushing: set = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._sweeper: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+
+    # ── Turns ──────────────────────────────────────────────────────────────────
+
+    async def begin_turn(self, phone_number: str) -> ProductSessionTurn:
+        """Load the session for one WhatsApp turn — from memory when cached, else one async query."""
+        if not self.cache_enabled:
+            handles, recent = await self._load(phone_number)
+            return ProductSessionTurn(phone_number, handles, recent, self._write_now)
+
+        with self._lock:
+            entry = self._cache.get(phone_number)
+            if entry is not None:
+                self._cache.move_to_end(phone_number)
+                self.hits += 1
+                # Copies — the turn mutates its own view, the cache is updated on flush
+                return ProductSessionTurn(phone_number, list(entry.handles), list(entry.recent), self._record)
+
+        self.misses += 1
+        handles, recent = await self._load(phone_number)
+        with self._lock:
+            # Another turn may have loaded (and appended to) it meanwhile — keep that one
+            entry = self._cache.get(phone_number)
+            if entry is None:
+                entry = _CachedSession(handles, recent)
+                self._cache[phone_number] = entry
+                self._evict_locked()
+            return ProductSessionTurn(phone_number, list(entry.handles), list(entry.recent), self._record)
+
+    @staticmethod
+    async def _load(phone_number: str):
+        async with AsyncSessionLocal() as db:
+            return await AsyncProductSessionRepository(db).load_session(
+                phone_number, settings.session_context_limit
+            )
+
+    @staticmethod
+    async def _write_now(phone_number: str, products: List[Dict]) -> None:
+        async with AsyncSessionLocal() as db:
+            await AsyncProductSessionRepository(db).append_products(phone_number, products)
+
+    async def _record(self, phone_number: str, products: List[Dict]) -> None:
+        """Apply a turn's products to the cached session and mark it dirty."""
+        with self._lock:
+            entry = self._cache.get(phone_number)
+        if entry is None:
+            # Evicted (it was clean) while the turn was running — reload before applying
+            entry = _CachedSession(*await self._load(phone_number))
+
+        with self._lock:
+            entry = self._cache.setdefault(phone_number, entry)
+            entry.handles = _cap_handles(_merge_handles(entry.handles, products))
+            entry.recent  = _merge_recent(entry.recent, products, settings.session_context_limit)
+            entry.pending.extend(products)
+            self._cache.move_to_end(phone_number)
+            self._dirty.add(phone_number)
+            dirty_count = len(self._dirty)
+            self._evict_locked()
+
+        if dirty_count >= settings.product_session_flush_dirty_threshold and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _evict_locked(self) -> None:
+        """Drop least-recently-used clean sessions. Unwritten ones stay until flushed."""
+        if len(self._cache) <= self.max_size:
+            return
+        for phone in list(self._cache):
+            if len(self._cache) <= self.max_size:
+                break
+            if phone not in self._dirty and phone not in self._flushing:
+                del self._cache[phone]
+
+    def invalidate(self, phone_number: Optional[str] = None) -> None:
+        """Forget cached session(s) whose DB rows changed underneath. Unwritten data is kept."""
+        with self._lock:
+            phones = [phone_number] if phone_number is not None else list(self._cache)
+            for phone in phones:
+                if phone not in self._dirty and phone not in self._flushing:
+                    self._cache.pop(phone, None)
+
+    # ── Write-behind ───────────────────────────────────────────────────────────
+
+    def flush_dirty(self) -> int:
+        """Write every dirty session in one transaction. Returns the number of sessions written."""
+        with self._lock:
+            batch = {}
+            for phone in self._dirty:
+                entry = self._cache.get(phone)
+                if entry is not None and entry.pending:
+                    batch[phone], entry.pending = entry.pending, []
+            self._dirty.clear()
+            self._flushing.update(batch)
+        if not batch:
+            return 0
+
+        try:
+            with SessionLocal() as db:
+                repo = ProductSessionRepository(db)
+                for phone, products in batch.items():
+                    repo.append_products(phone, products, commit=False)
+                db.commit()
+        except Exception:
+            # Put the products back (ahead of anything appended meanwhile) for the next attempt
+            with self._lock:
+                for phone, products in batch.items():
+                    self._cache[phone].pending[:0] = products
+                    self._dirty.add(phone)
+            raise
+        finally:
+            with self._lock:
+                self._flushing.difference_update(batch)
+                self._evict_locked()
+
+        logger.debug(f"Product session flush: {len(batch)} session(s) written")
+        return len(batch)
+
+    async def _flush_loop(self) -> None:
+        interval = settings.product_session_flush_interval_seconds
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._dirty:
+                continue
+            try:
+                await asyncio.to_thread(self.flush_dirty)
+            except Exception as e:
+                logger.error(f"Product session flush failed (will retry): {e}")
+
+    # ── Expiry / compaction ────────────────────────────────────────────────────
+
+    def sweep(self) -> Dict[str, int]:
+        """Delete expired sessions and compact long ones, one batch per transaction."""
+        batch_size = max(1, settings.product_session_sweep_batch_size)
+        expired = compacted = 0
+
+        with SessionLocal() as db:
+            repo = ProductSessionRepository(db)
+
+            if settings.product_session_ttl_seconds > 0:
+                cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.product_session_ttl_seconds)
+                while True:
+                    phones = repo.delete_expired(cutoff, batch_size)
+                    for phone in phones:
+                        self.invalidate(phone)
+                    expired += len(phones)
+                    if len(phones) < batch_size:
+                        break
+
+            if settings.product_session_max_products > 0:
+                while True:
+                    phones = repo.compact(settings.product_session_max_products, batch_size)
+                    for phone in phones:
+                        self.invalidate(phone)
+                    compacted += len(phones)
+                    if len(phones) < batch_size:
+                        break
+
+        if expired or compacted:
+            SESSIONS_SWEPT.inc("expired", amount=expired)
+            SESSIONS_SWEPT.inc("compacted", amount=compacted)
+            logger.info(f"🧹 Product session sweep: {expired} expired, {compacted} compacted")
+        return {"expired": expired, "compacted": compacted}
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.error(f"Product session sweep failed: {e}")
+            await asyncio.sleep(settings.product_session_sweep_interval_seconds)
+
+    # ── Lifecycle ──────────────────────────────────────────────────────────────
+
+    def start(self) -> None:
+        """Start the background flusher and sweeper (called from the app lifespan)."""
+        if self.cache_enabled and self._flusher is None:
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_loop())
+            logger.info(
+                f"Product session cache started — size={self.max_size}, "
+                f"flush every {settings.product_session_flush_interval_seconds}s "
+                f"or {settings.product_session_flush_dirty_threshold} dirty session(s)"
+            )
+        if settings.product_session_sweep_interval_seconds > 0 and self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self) -> None:
+        """Stop the background tasks and drain everything still dirty."""
+        for task in (self._flusher, self._sweeper):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._flusher = None
+        self._sweeper = None
+        self._wakeup = None
+        if self._dirty:
+            try:
+                written = await asyncio.to_thread(self.flush_dirty)
+                logger.info(f"Product session cache drained — {written} session(s) written")
+            except Exception as e:
+                logger.error(f"Product session drain failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._cache), "dirty": len(self._dirty), "hits": self.hits, "misses": self.misses}
+
+
+# Singleton instance
+product_session_service = ProductSessionService()
+
+
+def _session_cache_sizes():
+    stats = product_session_service.stats()
+    yield ("cached",), stats["size"]
+    yield ("dirty",),  stats["dirty"]
+
+
+def _session_cache_lookups():
+    stats = product_session_service.stats()
+    yield ("hit",),  stats["hits"]
+    yield ("miss",), stats["misses"]
+
+
+metrics.callback(
+    "product_session_cache_sessions", "Product sessions held in the write-behind cache.",
+    ["state"], _session_cache_sizes,
+)
+metrics.callback(
+    "product_session_cache_lookups_total", "Product session cache lookups by outcome.",
+    ["result"], _session_cache_lookups, type_name="counter",
+)
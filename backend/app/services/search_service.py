@@ -1,17 +1,30 @@
+import threading
+import time
 import meilisearch
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from app.config.settings import settings
+from app.services.async_search_client import async_search_client
 from app.utils.logger import get_logger
+from app.utils.metrics import MEILISEARCH_LATENCY
 
 logger = get_logger(__name__)
 
+def _task_uid(task) -> Any:
+    """TaskInfo is a dict on older meilisearch clients and a model on newer ones."""
+    uid = getattr(task, "task_uid", None)
+    return uid if uid is not None else task["taskUid"]
+
+
 class SearchService:
     def __init__(self):
         self._client = None
         self.url = settings.meilisearch_url
         self.api_key = settings.meilisearch_master_key
+        # Index handles are cached per name so queries don't pay a get_index round-trip
+        self._indexes: Dict[str, Any] = {}
+        self._index_lock = threading.Lock()
 
     @property
     def client(self) -> meilisearch.Client:
@@ -31,25 +44,58 @@ class SearchService:
 
     def get_index(self, index_name: str):
         """
-        Get or create an index.
+        Return the cached handle for an index, creating the index on first use.
+        Only the first call per name (normally at startup) talks to Meilisearch.
         """
+        index = self._indexes.get(index_name)
+        if index is not None:
+            return index
+
         if not self.client:
             logger.warning("Meilisearch client not initialized.")
             return None
-            
+
+        with self._index_lock:
+            index = self._indexes.get(index_name)
+            if index is None:
+                index = self._load_or_create_index(index_name)
+                if index is not None:
+                    self._indexes[index_name] = index
+        return index
+
+    def _load_or_create_index(self, index_name: str):
         try:
             # Check if index exists, create if not
             try:
                 index = self.client.get_index(index_name)
             except meilisearch.errors.MeilisearchApiError:
-               task = self.client.create_index(index_name, {'primaryKey': 'id'})
-               self.client.wait_for_task(task['taskUid'])
-               index = self.client.get_index(index_name)
+                logger.info(f"Index {index_name} not found — creating it")
+                task = self.client.create_index(index_name, {'primaryKey': 'id'})
+                self.client.wait_for_task(_task_uid(task))
+                index = self.client.get_index(index_name)
             return index
         except Exception as e:
             logger.error(f"Error getting index {index_name}: {e}")
             return None
 
+    def ensure_index(self, index_name: str) -> bool:
+        """Warm the handle cache (create-if-missing) — called once at startup."""
+        return self.get_index(index_name) is not None
+
+    def invalidate_index(self, index_name: Optional[str] = None) -> None:
+        """Forget a cached handle (or all of them), e.g. after the index was dropped."""
+        with self._index_lock:
+            if index_name is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(index_name, None)
+
+    def _handle_index_error(self, index_name: str, error: Exception) -> None:
+        """Drop the cached handle if Meilisearch says the index no longer exists."""
+        if getattr(error, "code", None) == "index_not_found":
+            logger.warning(f"Index {index_name} disappeared — invalidating cached handle")
+            self.invalidate_index(index_name)
+
     def update_settings(self, index_name: str, settings_dict: Dict[str, Any]):
         """
         Update index settings (e.g. for vector search).
@@ -60,10 +106,11 @@ class SearchService:
         
         try:
             task = index.update_settings(settings_dict)
-            logger.info(f"Updated settings for index {index_name}: {task} (taskUid: {task['taskUid']})")
+            logger.info(f"Updated settings for index {index_name}: {task} (taskUid: {_task_uid(task)})")
             return task
         except Exception as e:
             logger.error(f"Error updating settings for {index_name}: {e}")
+            self._handle_index_error(index_name, e)
 
     def add_documents(self, index_name: str, documents: List[Dict[str, Any]]):
         """
@@ -79,6 +126,7 @@ class SearchService:
             return task
         except Exception as e:
             logger.error(f"Error adding documents to {index_name}: {e}")
+            self._handle_index_error(index_name, e)
 
     def search(self, index_name: str, query: str = "", vector: Optional[List[float]] = None, limit: int = 10, filter: str = None) -> Dict[str, Any]:
         """
@@ -104,62 +152,52 @@ class SearchService:
             return result
         except Exception as e:
             logger.error(f"Error searching {index_name}: {e}")
+            self._handle_index_error(index_name, e)
             return {}
 
-    def perform_hybrid_search(
-        self,
-        query: str,
+    @staticmethod
+    def build_hybrid_params(
         text_vector: Optional[List[float]] = None,
         limit: int = 10,
         semantic_ratio: float = None,
         filter_str: Optional[str] = None,
         ranking_score_threshold: Optional[float] = None,
-    ) -> List[Dict[str, Any]]:
+    ) -> Dict[str, Any]:
         """
-        Runs text-embedding hybrid search in Meilisearch.
-        ranking_score_threshold: if set, only returns hits with _rankingScore >= threshold.
+        Search parameters shared by the sync and async hybrid search paths.
+        Without a vector this degrades to a keyword search (threshold ignored).
         """
-        if semantic_ratio is None:
-            semantic_ratio = settings.search_semantic_ratio
-
-        index = self.get_index(settings.meilisearch_index)
-        if not index:
-            return []
-
         if not text_vector:
-            try:
-                fallback_params: dict = {"limit": limit, "showRankingScore": True}
-                if filter_str:
-                    fallback_params["filter"] = filter_str
-                res = index.search(query, fallback_params)
-                text_hits = res.get("hits", [])
-            except Exception as e:
-                logger.error(f"Keyword search failed: {e}")
-                text_hits = []
-        else:
-            params: dict = {
-                "hybrid": {"embedder": "text", "semanticRatio": semantic_ratio},
-                "vector": text_vector,
-                "limit": limit,
-                "showRankingScore": True,
-            }
+            params: dict = {"limit": limit, "showRankingScore": True}
             if filter_str:
                 params["filter"] = filter_str
-            if ranking_score_threshold is not None:
-                params["rankingScoreThreshold"] = ranking_score_threshold
-            try:
-                res = index.search(query, params)
-                text_hits = res.get("hits", [])
-            except Exception as e:
-                logger.error(f"Text embedder search failed: {e}")
-                text_hits = []
+            return params
 
+        if semantic_ratio is None:
+            semantic_ratio = settings.search_semantic_ratio
+        params = {
+            "hybrid": {"embedder": "text", "semanticRatio": semantic_ratio},
+            "vector": text_vector,
+            "limit": limit,
+            "showRankingScore": True,
+        }
+        if filter_str:
+            params["filter"] = filter_str
+        if ranking_score_threshold is not None:
+            params["rankingScoreThreshold"] = ranking_score_threshold
+        return params
+
+    @staticmethod
+    def tag_hits(text_hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         # Tag each hit with source metadata (kept for UI badge compatibility)
         for hit in text_hits:
             hit.setdefault("_sources",      ["text"])
             hit.setdefault("_score",        1)
             hit.setdefault("_rankingScore", 0.0)
+        return text_hits
 
+    @staticmethod
+    def log_hits(text_hits: List[Dict[str, Any]]) -> None:
         if text_hits:
             logger.info("━" * 60)
             logger.info(f"📊 SEARCH RESULTS (Total: {len(text_hits)})")
@@ -169,7 +207,104 @@ class SearchService:
                 logger.info(f"  {i+1:2d}. [rank: {ranking_score:.4f}] {handle}")
             logger.info("━" * 60)
 
+    def finalize_hits(self, text_hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Tag hits with source metadata and log the ranking summary."""
+        self.tag_hits(text_hits)
+        self.log_hits(text_hits)
         return text_hits
 
+    def perform_hybrid_search(
+        self,
+        query: str,
+        text_vector: Optional[List[float]] = None,
+        limit: int = 10,
+        semantic_ratio: float = None,
+        filter_str: Optional[str] = None,
+        ranking_score_threshold: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Runs text-embedding hybrid search in Meilisearch.
+        ranking_score_threshold: if set, only returns hits with _rankingScore >= threshold.
+        Blocking — async callers should use perform_hybrid_search_async().
+        """
+        index = self.get_index(settings.meilisearch_index)
+        if not index:
+            return []
+
+        params = self.build_hybrid_params(
+            text_vector, limit, semantic_ratio, filter_str, ranking_score_threshold
+        )
+        started = time.perf_counter()
+        try:
+            res = index.search(query, params)
+            text_hits = res.get("hits", [])
+        except Exception as e:
+            label = "Text embedder" if text_vector else "Keyword"
+            logger.error(f"{label} search failed: {e}")
+            self._handle_index_error(settings.meilisearch_index, e)
+            text_hits = []
+        MEILISEARCH_LATENCY.observe(time.perf_counter() - started, "search_sync")
+
+        return self.finalize_hits(text_hits)
+
+    async def perform_hybrid_search_async(
+        self,
+        query: str,
+        text_vector: Optional[List[float]] = None,
+        limit: int = 10,
+        semantic_ratio: float = None,
+        filter_str: Optional[str] = None,
+        ranking_score_threshold: Optional[float] = None,
+        log_results: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """
+        Same as perform_hybrid_search(), but over the pooled async REST client —
+        no worker thread per query. Default for request handlers.
+        log_results=False skips the ranking log (cascade stages log only the winner).
+        """
+        params = self.build_hybrid_params(
+            text_vector, limit, semantic_ratio, filter_str, ranking_score_threshold
+        )
+        try:
+            res = await async_search_client.search(settings.meilisearch_index, query, params)
+            text_hits = res.get("hits", [])
+        except Exception as e:
+            label = "Text embedder" if text_vector else "Keyword"
+            logger.error(f"{label} search failed: {e}")
+            text_hits = []
+
+        if not log_results:
+            return self.tag_hits(text_hits)
+        return self.finalize_hits(text_hits)
+
+    async def perform_hybrid_multi_search_async(
+        self,
+        query: str,
+        text_vector: Optional[List[float]],
+        limit: int,
+        stages: List[Tuple[Optional[str], Optional[float]]],
+        semantic_ratio: float = None,
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Runs several (filter_str, ranking_score_threshold) variants of the same
+        hybrid query in a single /multi-search request.
+        Returns one tagged hit list per stage, in the order given. Hits are not
+        logged — the caller decides which stage wins. Raises on transport errors
+        so the caller can fall back to per-stage searches.
+        """
+        queries = [
+            {
+                "indexUid": settings.meilisearch_index,
+                "q": query,
+                **self.build_hybrid_params(text_vector, limit, semantic_ratio, f_str, min_score),
+            }
+            for f_str, min_score in stages
+        ]
+        res = await async_search_client.multi_search(queries)
+        results = res.get("results", [])
+        if len(results) != len(queries):
+            raise ValueError(f"multi-search returned {len(results)} results for {len(queries)} queries")
+        return [self.tag_hits(r.get("hits", [])) for r in results]
+
 # Singleton instance
 search_service = SearchService()
@@ -4,12 +4,14 @@ from urllib.parse import urlencode
 
 import httpx
 from fastapi import HTTPException, status, BackgroundTasks
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ingest_products import ingest_products
 
 from app.config.settings import settings
-from app.database.repositories.shop_installation_repository import ShopInstallationRepository
+from app.database.repositories.shop_installation_repository import (
+    AsyncShopInstallationRepository,
+)
 from app.utils.logger import get_logger
 from app.utils.security import is_valid_shop_domain, mask_token, verify_shopify_hmac
 
@@ -73,7 +75,7 @@ class ShopifyAuthService:
     # Callback / token exchange
     # ------------------------------------------------------------------
 
-    async def handle_callback(self, query_params: dict[str, str], db: Session) -> tuple[str, str]:
+    async def handle_callback(self, query_params: dict[str, str], db: AsyncSession) -> tuple[str, str]:
         logger.debug("handle_callback called — params_keys=%s", sorted(query_params.keys()))
 
         required = {"shop", "code", "state", "hmac"}
@@ -238,8 +240,8 @@ class ShopifyAuthService:
 
         # ── Save to database ───────────────────────────────────────────────────
         logger.info("Saving installation to DB — shop=%s access_mode=%s", shop, access_mode)
-        repo = ShopInstallationRepository(db)
-        repo.upsert(
+        repo = AsyncShopInstallationRepository(db)
+        await repo.upsert(
             shop_domain=shop,
             access_mode=access_mode,
             access_token=access_token,
@@ -265,7 +267,7 @@ class ShopifyAuthService:
     # ------------------------------------------------------------------
 
     async def exchange_token(
-        self, *, id_token: str, shop: str, db: Session, background_tasks: BackgroundTasks = None
+        self, *, id_token: str, shop: str, db: AsyncSession, background_tasks: BackgroundTasks = None
     ) -> str:
         """Exchange a Shopify session token (id_token JWT) for a permanent
         offline access token using the Token Exchange grant type.
@@ -334,8 +336,8 @@ class ShopifyAuthService:
         logger.info("─" * 60)
 
         # Save the offline token to the database
-        repo = ShopInstallationRepository(db)
-        repo.upsert(
+        repo = AsyncShopInstallationRepository(db)
+        await repo.upsert(
             shop_domain=shop,
             access_mode="offline",
             access_token=access_token,
@@ -0,0 +1,109 @@
+"""
+HTTP Clients
+────────────
+Registry of long-lived, pooled httpx.AsyncClients, one per outbound target.
+
+Opening a client per call pays DNS, TCP and TLS setup on every request to the
+same host. Each target here gets one keep-alive pool (per event loop) with its
+own limits and timeouts, created on first use and closed by the app lifespan.
+HTTP/2 is negotiated over TLS when the `h2` package is installed
+(pip install "httpx[http2]"); without it the clients speak HTTP/1.1.
+
+Targets:
+  • wa_platform     — WA Platform API (send-message, provisioning)
+  • product_images  — product image CDN downloads for card dispatch
+"""
+import asyncio
+import importlib.util
+from typing import Callable, Dict, Optional
+
+import httpx
+
+from app.config.settings import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def _wa_platform_options() -> dict:
+    return {
+        "http2": settings.wa_platform_http2,
+        "timeout": httpx.Timeout(
+            settings.wa_platform_timeout_seconds,
+            connect=settings.wa_platform_connect_timeout_seconds,
+        ),
+        "limits": httpx.Limits(
+            max_connections=settings.wa_platform_max_connections,
+            max_keepalive_connections=settings.wa_platform_max_keepalive_connections,
+            keepalive_expiry=settings.wa_platform_keepalive_expiry_seconds,
+        ),
+    }
+
+
+def _product_images_options() -> dict:
+    return {
+        "http2": settings.product_image_http2,
+        "timeout": httpx.Timeout(settings.product_image_timeout_seconds, connect=5.0),
+        "limits": httpx.Limits(
+            max_connections=max(1, settings.product_image_download_concurrency),
+            max_keepalive_connections=max(1, settings.product_image_download_concurrency),
+        ),
+    }
+
+
+class HttpClientRegistry:
+    """Named httpx.AsyncClients, created lazily for the running event loop."""
+
+    def __init__(self):
+        self._targets: Dict[str, Callable[[], dict]] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def register(self, name: str, options: Callable[[], dict]) -> None:
+        """Declare a target; `options` returns the httpx.AsyncClient kwargs (read when the client is built)."""
+        self._targets[name] = options
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Clients are bound to the loop that created them — start over on a new one
+            self._release(self._clients, self._loop)
+            self._clients = {}
+            self._loop = loop
+        client = self._clients.get(name)
+        if client is None:
+            options = self._targets[name]()
+            if options.get("http2") and not HTTP2_AVAILABLE:
+                options["http2"] = False
+            client = httpx.AsyncClient(**options)
+            self._clients[name] = client
+            logger.info(f"Created pooled HTTP client '{name}' (http2={options.get('http2', False)})")
+        return client
+
+    @staticmethod
+    def _release(clients: Dict[str, httpx.AsyncClient], loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        """Close clients left on a previous event loop — only possible while that loop still runs."""
+        if not clients:
+            return
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            for client in clients.values():
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            return
+        logger.warning(
+            f"Dropping HTTP client(s) {sorted(clients)} left on a finished event loop without closing them "
+            "— call http_clients.aclose() before the loop ends"
+        )
+
+    async def aclose(self) -> None:
+        """Close every client (called on app shutdown)."""
+        clients, self._clients, self._loop = self._clients, {}, None
+        for client in clients.values():
+            await client.aclose()
+
+
+# Singleton instance
+http_clients = HttpClientRegistry()
+http_clients.register("wa_platform", _wa_platform_options)
+http_clients.register("product_images", _product_images_options)
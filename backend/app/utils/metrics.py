@@ -0,0 +1,251 @@
+"""Tiny Prometheus-compatible metrics registry.
+
+Usage::
+
+    from app.utils.metrics import metrics
+
+    REQUESTS = metrics.counter("http_requests_total", "HTTP requests", ["method", "route", "status"])
+    REQUESTS.inc("GET", "/health", "200")
+
+    LATENCY = metrics.histogram("http_request_duration_seconds", "Request latency", ["method", "route"])
+    LATENCY.observe(0.012, "GET", "/health")
+
+    metrics.render()   # -> Prometheus text exposition format (served at GET /metrics)
+
+The hot path is allocation-light: label values are passed positionally and
+used directly as the dict key, and a histogram observation is one bisect
+plus two list increments. No locks are taken on update — a rare lost
+increment under thread contention is an acceptable trade for metrics.
+"""
+
+import bisect
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds — tuned for 1 ms … 30 s (LLM calls sit at the top end)
+DEFAULT_LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        super().__init__(name, help_text, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labels, value in list(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name, help_text, label_names=()):
+        super().__init__(name, help_text, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, *label_values: str) -> None:
+        self._values[label_values] = value
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def dec(self, *label_values: str, amount: float = 1.0) -> None:
+        self._values[label_values] = self._values.get(label_values, 0.0) - amount
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labels, value in list(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last)..., sum, count]
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series.setdefault(label_values, [0] * (len(self.buckets) + 1) + [0.0, 0])
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labels, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series[:-2]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            label_str = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{label_str} {_format_value(series[-1])}")
+        return lines
+
+
+class _CallbackMetric(_Metric):
+    """Value(s) computed at scrape time — for stats that already live elsewhere."""
+
+    def __init__(self, name, help_text, label_names, type_name: str,
+                 collect: Callable[[], Iterable[Tuple[LabelValues, float]]]):
+        super().__init__(name, help_text, label_names)
+        self.type_name = type_name
+        self._collect = collect
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labels, value in self._collect():
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        # Re-registering the same name returns the existing metric (module reloads, tests)
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, label_names))
+
+    def gauge(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Sequence[str] = (),
+        buckets: Optional[Sequence[float]] = None,
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, label_names, buckets or DEFAULT_LATENCY_BUCKETS))
+
+    def callback(
+        self,
+        name: str,
+        help_text: str,
+        label_names: Sequence[str],
+        collect: Callable[[], Iterable[Tuple[LabelValues, float]]],
+        type_name: str = "gauge",
+    ) -> _Metric:
+        return self._register(_CallbackMetric(name, help_text, label_names, type_name, collect))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                # A broken collector must never take the whole scrape down
+                continue
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+# ── Shared application metrics ─────────────────────────────────────────────────
+
+HTTP_REQUESTS = metrics.counter(
+    "http_requests_total", "HTTP requests handled, by route template and status.",
+    ["method", "route", "status"],
+)
+HTTP_LATENCY = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.",
+    ["method", "route"],
+)
+OPENAI_LATENCY = metrics.histogram(
+    "openai_request_duration_seconds", "OpenAI API call latency (including retries).",
+    ["operation"],
+)
+OPENAI_TOKENS = metrics.counter(
+    "openai_tokens_total", "OpenAI tokens consumed.",
+    ["operation", "kind"],
+)
+MEILISEARCH_LATENCY = metrics.histogram(
+    "meilisearch_request_duration_seconds", "Meilisearch request latency.",
+    ["operation"],
+)
+BACKGROUND_TASKS = metrics.gauge(
+    "background_tasks_in_flight", "Background tasks scheduled but not yet finished.",
+    ["task"],
+)
+SEARCH_EXCLUSION_FILTER_CHARS = metrics.histogram(
+    "search_exclusion_filter_chars", "Length of the handle NOT IN [...] filter clause sent to Meilisearch.",
+    ["strategy"],
+    buckets=(0, 100, 500, 1_000, 2_500, 5_000, 10_000, 25_000, 50_000),
+)
+DISPATCH_IMAGE_BYTES_SAVED = metrics.histogram(
+    "dispatch_image_bytes_saved", "Image bytes saved by the transform stage per product dispatch.",
+    buckets=(0, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000, 10_000_000),
+)
+PIPELINE_SPANS = metrics.histogram(
+    "pipeline_span_duration_seconds", "WhatsApp message pipeline span durations.",
+    ["span"],
+)
+
+
+def record_openai_usage(operation: str, usage) -> None:
+    """Count prompt/completion tokens from an OpenAI response.usage object (may be None)."""
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", None)
+    completion = getattr(usage, "completion_tokens", None)
+    if prompt:
+        OPENAI_TOKENS.inc(operation, "prompt", amount=prompt)
+    if completion:
+        OPENAI_TOKENS.inc(operation, "completion", amount=completion)
@@ -0,0 +1,163 @@
+"""Lightweight span timers for the WhatsApp message hot path.
+
+Usage::
+
+    from app.utils.timing import span, start_trace
+
+    trace = start_trace("whatsapp_message", shop=domain)
+    with span("embedding"):
+        vector = await embedding_service.embed_text_async(query)
+    trace.finish()
+
+Each finished trace emits ONE structured JSON log line (logger ``app.trace``)
+with the duration of every span. Every span duration is also recorded in an
+in-process latency histogram so p50/p95/p99 can be read from
+``/metrics/pipeline`` without any external tooling, and exported as the
+``pipeline_span_duration_seconds`` Prometheus histogram on ``/metrics``.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from app.utils.metrics import PIPELINE_SPANS
+
+trace_logger = logging.getLogger("app.trace")
+
+# Samples kept per histogram — percentiles are computed over this recent window
+_RESERVOIR_SIZE = 2048
+
+
+class LatencyHistogram:
+    """Rolling window of recent samples plus lifetime count/sum."""
+
+    def __init__(self, maxlen: int = _RESERVOIR_SIZE):
+        self._samples: deque = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_ms = 0.0
+
+    def record(self, duration_ms: float) -> None:
+        with self._lock:
+            self._samples.append(duration_ms)
+            self.count += 1
+            self.total_ms += duration_ms
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total = self.count, self.total_ms
+        if not samples:
+            return {"count": count}
+
+        def pct(p: float) -> float:
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))], 2)
+
+        return {
+            "count":   count,
+            "mean_ms": round(total / count, 2),
+            "p50_ms":  pct(0.50),
+            "p95_ms":  pct(0.95),
+            "p99_ms":  pct(0.99),
+            "max_ms":  round(samples[-1], 2),
+        }
+
+
+class LatencyRegistry:
+    """Name → LatencyHistogram, created on first use."""
+
+    def __init__(self):
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, duration_ms: float) -> None:
+        PIPELINE_SPANS.observe(duration_ms / 1000, name)
+        hist = self._histograms.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.setdefault(name, LatencyHistogram())
+        hist.record(duration_ms)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {name: hist.snapshot() for name, hist in sorted(self._histograms.items())}
+
+
+latency_histograms = LatencyRegistry()
+
+
+class MessageTrace:
+    """Collects span durations for one unit of work (one incoming message)."""
+
+    def __init__(self, name: str, **fields: Any):
+        self.name = name
+        self.fields: Dict[str, Any] = dict(fields)
+        self.spans: Dict[str, float] = {}
+        self._started = time.perf_counter()
+        self._finished = False
+
+    def add(self, name: str, duration_ms: float) -> None:
+        """Record an externally measured span (repeated names are summed)."""
+        self.spans[name] = round(self.spans.get(name, 0.0) + duration_ms, 2)
+        latency_histograms.record(name, duration_ms)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000)
+
+    def finish(self, **fields: Any) -> None:
+        """Emit the structured record. Safe to call more than once — only the first call counts."""
+        if self._finished:
+            return
+        self._finished = True
+        self.fields.update(fields)
+        total_ms = round((time.perf_counter() - self._started) * 1000, 2)
+        latency_histograms.record(f"{self.name}.total", total_ms)
+        trace_logger.info(
+            json.dumps(
+                {"event": self.name, **self.fields, "total_ms": total_ms, "spans_ms": self.spans},
+                ensure_ascii=True,
+                default=str,
+            )
+        )
+
+
+_current_trace: ContextVar[Optional[MessageTrace]] = ContextVar("current_trace", default=None)
+
+
+def start_trace(name: str, **fields: Any) -> MessageTrace:
+    """Create a trace and make it current for this task (and tasks it spawns)."""
+    trace = MessageTrace(name, **fields)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[MessageTrace]:
+    return _current_trace.get()
+
+
+def record_span(name: str, duration_ms: float) -> None:
+    """Attach a duration to the current trace, or just the histogram if there is none."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, duration_ms)
+    else:
+        latency_histograms.record(name, duration_ms)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the enclosed block as a span of the current trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, (time.perf_counter() - started) * 1000)
@@ -15,9 +15,11 @@ Usage (run from the repo root):
     python ingest_from_json.py --file my_products.json
     python ingest_from_json.py --limit 50             # embed only first N products
     python ingest_from_json.py --skip-images          # text-only (faster for testing)
+    python ingest_from_json.py --prewarm-images       # also load card images into the image cache
 """
 
 import argparse
+import asyncio
 import json
 import os
 import sys
@@ -35,6 +37,8 @@ sys.path.insert(0, str(BACKEND_DIR))
 from app.config.settings import settings
 from app.services.embedding_service import embedding_service
 from app.services.image_caption_service import image_caption_service
+from app.services.image_prewarm import prewarm_images
+from app.utils.http_clients import http_clients
 
 import meilisearch
 
@@ -184,7 +188,15 @@ def upload_batch(index, docs: List[Dict[str, Any]], client: meilisearch.Client):
 # Main ingestion loop  (3 phases)
 # ──────────────────────────────────────────────────────────────────────────────
 
-def ingest(json_path: Path, limit: Optional[int]):
+async def _prewarm(urls: List[Optional[str]]) -> Dict[str, int]:
+    """Run the prewarm stage, closing the pooled HTTP clients before the loop ends."""
+    try:
+        return await prewarm_images(urls)
+    finally:
+        await http_clients.aclose()
+
+
+def ingest(json_path: Path, limit: Optional[int], prewarm: bool = False):
     print(f"\n{'─'*60}")
     print(f"  Source : {json_path}")
     print(f"  Index  : {INDEX_NAME}  @ {settings.meilisearch_url}")
@@ -314,6 +326,17 @@ def ingest(json_path: Path, limit: Optional[int]):
     print(f"  Skipped : {skipped}")
     print(f"{'─'*60}\n")
 
+    # ── Optional — prewarm the card image cache ───────────────────────────────
+    # Same URLs as the indexed documents, so dispatch finds them under the same key.
+    # Resumable: images already fresh in the cache are skipped.
+    if prewarm:
+        urls = [row["image_url"] for i, row in enumerate(rows) if text_vectors[i] is not None]
+        print(f"[Prewarm] Loading card images into the image cache…")
+        counts = asyncio.run(_prewarm(urls))
+        print(f"  Warmed  : {counts['warmed']}")
+        print(f"  Cached  : {counts['cached']}  (already fresh)")
+        print(f"  Failed  : {counts['failed']}\n")
+
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Entry point
@@ -330,10 +353,14 @@ if __name__ == "__main__":
         "--limit", type=int, default=None,
         help="Only process the first N products (useful for testing)",
     )
+    parser.add_argument(
+        "--prewarm-images", action="store_true",
+        help="Download (and transform) every product image into the image cache after indexing",
+    )
     args = parser.parse_args()
 
     if not args.file.exists():
         print(f"❌  File not found: {args.file}")
         sys.exit(1)
 
-    ingest(args.file, args.limit)
+    ingest(args.file, args.limit, prewarm=args.prewarm_images)
@@ -9,8 +9,10 @@ from app.config.settings import settings
 from app.database.engine import get_db
 from app.database.repositories.shop_installation_repository import ShopInstallationRepository
 from app.services.embedding_service import embedding_service
+from app.services.image_prewarm import prewarm_images
 from app.services.search_service import search_service
 from app.services.shopify_service import ShopifyService
+from app.utils.http_clients import http_clients
 from app.utils.logger import get_logger
 
 logging.basicConfig(level=logging.INFO)
@@ -80,7 +82,7 @@ def _is_available(product: Dict[str, Any]) -> bool:
     return False
 
 
-async def ingest_products(shop_domain: str):
+async def ingest_products(shop_domain: str, prewarm: Optional[bool] = None):
     """
     Full ingestion pipeline:
        1. Fetch all products from Shopify.
@@ -88,6 +90,8 @@ async def ingest_products(shop_domain: str):
           a. Extract metadata (colors, sizes, price, category, etc.)
           b. Embed title+description → text vector  (OpenAI text-embedding-3-small, 1536-dim)
        3. Upload all documents to Meilisearch.
+       4. Optionally prewarm the product image cache (prewarm, default
+          settings.image_prewarm_on_sync).
     """
     if not settings.openai_api_key:
         logger.error("OPENAI_API_KEY not set — aborting ingestion.")
@@ -193,6 +197,14 @@ async def ingest_products(shop_domain: str):
         task = search_service.add_documents(index_name, documents)
         logger.info("Indexed %d/%d products for %s → task: %s", len(documents), total, shop_domain, task)
         _update_status(shop_domain, "done", total=total, done=len(documents))
+        # ── Prewarm card images (after "done" — products are searchable already) ─
+        if prewarm is None:
+            prewarm = settings.image_prewarm_on_sync
+        if prewarm:
+            await prewarm_images(
+                (doc["image_url"] for doc in documents),
+                client=http_clients.get("product_images"),
+            )
     else:
         logger.warning("No documents indexed for %s.", shop_domain)
         _update_status(shop_domain, "done", total=0, done=0)
@@ -216,7 +228,15 @@ def get_sync_status(shop_domain: str) -> Dict[str, Any]:
 # ── CLI entry point ────────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python ingest_products.py <shop_domain>")
+    args = [a for a in sys.argv[1:] if a != "--prewarm-images"]
+    if len(args) != 1:
+        print("Usage: python ingest_products.py <shop_domain> [--prewarm-images]")
         sys.exit(1)
-    asyncio.run(ingest_products(sys.argv[1]))
+
+    async def _main():
+        try:
+            await ingest_products(args[0], prewarm=True if "--prewarm-images" in sys.argv else None)
+        finally:
+            await http_clients.aclose()
+
+    asyncio.run(_main())
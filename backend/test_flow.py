@@ -4,11 +4,12 @@ Shopify Auth Backend – Flow Test Script
 
 Tests the full OAuth flow without needing a real Shopify store.
 
-It runs in two modes:
+It runs in three parts:
   1. INTEGRATION tests  – hits the running uvicorn server via HTTP (httpx).
   2. UNIT / HAPPY-PATH  – imports the service directly and mocks Shopify's
                           token endpoint, so the complete code path is
                           exercised in-process.
+  3. EVENT LOOPS        – pooled async clients released when the loop changes.
 
 Usage (from the backend/ directory, with venv active):
     python test_flow.py
@@ -23,6 +24,7 @@ import hmac as hmac_lib
 import json
 import os
 import sys
+import threading
 import time
 import unittest.mock
 from datetime import datetime, timezone
@@ -45,9 +47,10 @@ except ImportError:
     pass
 
 from sqlalchemy import select
-from app.database.engine import Base, SessionLocal, engine
+from app.database.engine import AsyncSessionLocal, Base, SessionLocal, dispose_async_engine, engine
 from app.database.models import ShopInstallation
 from app.database.models.shop_installation import ShopInstallation as SI
+from app.services.async_search_client import AsyncMeilisearchClient
 from app.services.shopify_auth_service import ShopifyAuthService
 
 # ---------------------------------------------------------------------------
@@ -280,6 +283,17 @@ def run_integration_tests(base_url: str):
 # ── PART 2: Happy-path unit test (mocks Shopify's token endpoint)
 # ---------------------------------------------------------------------------
 
+def _run_callback(service: ShopifyAuthService, params: dict):
+    """handle_callback on its own AsyncSession (each asyncio.run gets a fresh loop)."""
+    async def _run():
+        try:
+            async with AsyncSessionLocal() as adb:
+                return await service.handle_callback(params, adb)
+        finally:
+            await dispose_async_engine()
+    return asyncio.run(_run())
+
+
 def run_happy_path_unit_test():
     _section("7. Full OAuth Happy Path (in-process, Shopify mocked)")
 
@@ -335,9 +349,7 @@ def run_happy_path_unit_test():
         try:
             with unittest.mock.patch("app.services.shopify_auth_service.httpx.AsyncClient",
                                      return_value=mock_outer):
-                result_shop, result_mode = asyncio.run(
-                    service.handle_callback(callback_params, db)
-                )
+                result_shop, result_mode = _run_callback(service, callback_params)
 
             _record("handle_callback returns correct shop",        result_shop == shop)
             _record("handle_callback returns correct access_mode", result_mode == "offline")
@@ -359,7 +371,7 @@ def run_happy_path_unit_test():
 
         # ── Step E: Verify state is not re-usable ─────────────────────────────
         try:
-            asyncio.run(service.handle_callback(callback_params, db))
+            _run_callback(service, callback_params)
             _record("State re-use raises HTTPException", False, "No exception raised")
         except Exception:
             _record("State re-use raises HTTPException (401)", True)
@@ -372,7 +384,7 @@ def run_happy_path_unit_test():
         bad_params["hmac"]  = "deadbeef"   # wrong hash
 
         try:
-            asyncio.run(service.handle_callback(bad_params, db))
+            _run_callback(service, bad_params)
             _record("Bad HMAC raises HTTPException", False, "No exception raised")
         except Exception:
             _record("Bad HMAC raises HTTPException (401)", True)
@@ -382,6 +394,43 @@ def run_happy_path_unit_test():
         Base.metadata.drop_all(bind=engine)
 
 
+# ---------------------------------------------------------------------------
+# ── PART 3: Pooled clients across event loops
+# ---------------------------------------------------------------------------
+
+def run_event_loop_change_test():
+    _section("8. Pooled Client Across Event Loops (no server needed)")
+
+    search = AsyncMeilisearchClient("http://localhost:7700", "key")
+
+    async def _client():
+        return search.client
+
+    # A loop that is still running (e.g. another thread) — its client is closed on it
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        first = asyncio.run_coroutine_threadsafe(_client(), loop).result(timeout=5)
+
+        async def _switch_and_close():
+            second = search.client
+            await asyncio.sleep(0.1)   # Let the old loop run the scheduled aclose
+            try:
+                return second, first.is_closed
+            finally:
+                await search.aclose()
+
+        second, first_closed = asyncio.run(_switch_and_close())
+        _record("New loop gets a new client", second is not first)
+        _record("Old loop's client is closed on the switch", first_closed)
+        _record("aclose() closes the current client", second.is_closed)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+
+
 # ---------------------------------------------------------------------------
 # ── Summary
 # ---------------------------------------------------------------------------
@@ -433,4 +482,5 @@ if __name__ == "__main__":
         print(f"\n  {INFO}  Skipping integration tests (--skip-server)")
 
     run_happy_path_unit_test()
+    run_event_loop_change_test()
     _print_summary()